@@ -0,0 +1,160 @@
+"""
+消息分发基准测试
+注册合成的模块/服务/触发器 生成群聊 私聊 频道消息 在无网络的FakeBot上驱动 handle_message
+
+在项目根目录运行:
+    python bench/dispatch.py --triggers 200 --messages 20000 --save bench/baseline.json
+    python bench/dispatch.py --triggers 200 --messages 20000 --compare bench/baseline.json
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from nonebot.exception import FinishedException
+
+import harness
+
+TRIGGER_TYPES = ('prefix', 'full', 'regex', 'keyword', 'fuzzy')
+CHATTER = [
+    '今天天气不错', '有人吗', '哈哈哈哈', '晚上吃什么', '这个怎么弄', '[CQ:face,id=178]', '好耶',
+    '明天几点集合', '收到', '+1', '我也想要', '刚刚掉线了', '在打本 等一下', '看看这个链接 https://example.com/a',
+]
+
+
+def word(rng: random.Random, length: int = 4) -> str:
+    return ''.join(chr(rng.randint(0x4e00, 0x4fff)) for _ in range(length))
+
+
+def register(triggers: int, modules: int, reply: bool, seed: int) -> dict:
+    """
+    注册 modules 个模块 每种触发类型 triggers 个触发器
+    关键词触发器注册为非主动功能 其余为主动功能
+    返回 {触发类型: [可命中该触发器的消息]}
+    """
+    from kirabot.handler import Module
+
+    rng = random.Random(seed)
+    services = []
+    for m in range(modules):
+        module = Module(f'bench{m}', field=(1, 1, 1))
+        for s in range(5):
+            services.append(module.add_service(f'sv{s}', field=(1, 1, 1)))
+
+    def handler(service, index: int):
+        async def bench_function(bot, event):
+            if reply:
+                await service.reply(event, f'ok {index}')
+
+        return bench_function
+
+    samples = {kind: [] for kind in TRIGGER_TYPES}
+    for kind in TRIGGER_TYPES:
+        for i in range(triggers):
+            service = services[rng.randrange(len(services))]
+            key = word(rng)
+            if kind == 'prefix':
+                service.at_message(kind, key)(handler(service, i))
+                samples[kind].append(f'{key} {rng.randint(1, 999)}')
+            elif kind == 'full':
+                service.at_message(kind, key)(handler(service, i))
+                samples[kind].append(key)
+            elif kind == 'regex':
+                service.at_message(kind, rf'^{key}(\d+)$')(handler(service, i))
+                samples[kind].append(f'{key}{rng.randint(1, 9999)}')
+            elif kind == 'keyword':
+                service.at_message(kind, key, positive=False)(handler(service, i))
+                samples[kind].append(f'{rng.choice(CHATTER)}{key}{rng.choice(CHATTER)}')
+            else:
+                service.at_message(kind, key + word(rng, 4))(handler(service, i))
+                samples[kind].append(key + word(rng, 3))
+    return samples
+
+
+def generate(factory: harness.EventFactory, samples: dict, count: int, hit_rate: float) -> list:
+    rng = factory.random
+    events = []
+    for _ in range(count):
+        if rng.random() < hit_rate:
+            text = rng.choice(samples[rng.choice(TRIGGER_TYPES)])
+        else:
+            text = rng.choice(CHATTER)
+        events.append(factory.message(text))
+    return events
+
+
+async def run(args) -> dict:
+    from kirabot import handle
+    from kirabot.handler.outbox import outbox
+
+    bot = harness.connect()
+    samples = register(args.triggers, args.modules, args.reply, args.seed)
+    factory = harness.EventFactory(args.seed)
+
+    async def dispatch(event):
+        try:
+            await handle.handle_message(bot, event)
+        except FinishedException:
+            pass
+
+    async def settle():
+        while handle.passive_tasks or outbox.depth() or outbox.stats()['sending']:
+            await asyncio.sleep(0)
+
+    # 预热 建立区域调度表 触发器索引与权限缓存
+    for data in generate(factory, samples, args.warmup, args.hit_rate):
+        await dispatch(harness.to_event(data))
+    await settle()
+
+    events = [harness.to_event(data) for data in generate(factory, samples, args.messages, args.hit_rate)]
+    with harness.StageRecorder() as recorder:
+        start = time.perf_counter()
+        for event in events:
+            await dispatch(event)
+        await settle()
+        elapsed = time.perf_counter() - start
+
+    result = {
+        'environment': harness.environment(),
+        'options': vars(args),
+        'messages': len(events),
+        'elapsed': elapsed,
+        'throughput': len(events) / elapsed,
+        'stages': {stage: harness.percentiles(values) for stage, values in recorder.stages.items()},
+        'api_calls': dict(bot.calls),
+    }
+    if args.allocations:
+        events = iter([harness.to_event(data) for data in generate(factory, samples, args.allocations, args.hit_rate)])
+        result['allocations'] = await harness.measure_allocations(lambda: dispatch(next(events)), args.allocations)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='KiraBot dispatch benchmark')
+    parser.add_argument('--triggers', type=int, default=100, help='每种触发类型的触发器数')
+    parser.add_argument('--modules', type=int, default=10, help='模块数 每个模块5个服务')
+    parser.add_argument('--messages', type=int, default=10000, help='计时的消息数')
+    parser.add_argument('--warmup', type=int, default=1000, help='预热消息数')
+    parser.add_argument('--allocations', type=int, default=1000, help='统计内存分配的消息数 为0时不统计')
+    parser.add_argument('--hit-rate', type=float, default=0.3, help='命中触发器的消息比例')
+    parser.add_argument('--reply', action='store_true', help='命中的功能通过发送队列回复')
+    parser.add_argument('--with-modules', action='store_true', help='同时加载内置模块与配置中启用的模块')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='将结果保存为基线')
+    parser.add_argument('--compare', help='与基线比较 有退化时返回非0')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='比较时允许的退化比例')
+    args = parser.parse_args()
+
+    harness.boot(args.with_modules)
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    harness.report(result)
+    if args.save:
+        harness.save(result, args.save)
+        print(f'\nBaseline saved to {args.save}')
+    if args.compare and not harness.compare(result, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
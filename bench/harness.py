@@ -0,0 +1,225 @@
+"""
+基准测试公共部分
+在不连接网络的情况下初始化KiraBot 由 FakeBot 接收所有API调用
+"""
+import asyncio
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nonebot
+from nonebot.adapters.onebot.v11 import Adapter, Bot
+
+SELF_ID = '10000'
+GUILD_TINY_ID = 20000
+
+
+class FakeBot(Bot):
+    """不连接协议端的Bot 记录所有API调用并返回固定结果"""
+
+    def __init__(self, adapter: Adapter, self_id: str = SELF_ID, latency: float = 0):
+        super().__init__(adapter, self_id)
+        self.latency = latency
+        self.calls: {str: int} = defaultdict(int)
+        self._message_id = itertools.count(1)
+
+    async def call_api(self, api: str, **data):
+        self.calls[api] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if api.startswith('send_'):
+            return {'message_id': next(self._message_id)}
+        return {}
+
+
+def boot(with_modules: bool = False):
+    """
+    初始化KiraBot
+    with_modules: 是否加载内置模块与配置中启用的模块 默认只使用基准测试注册的模块
+    """
+    from kirabot import bot, config
+    from kirabot.utils import send_bucket
+
+    if not with_modules:
+        config.BUILT_IN_MODULE = []
+        config.MODULES_ON = []
+    bot.init()
+    # 基准测试只测量分发 发送队列不限速
+    send_bucket.rate = send_bucket.capacity = send_bucket.tokens = 1e9
+    from kirabot.handler.outbox import outbox
+    outbox.area_interval = 0
+    # 重放时不再记录事件
+    from kirabot.recorder import recorder
+    recorder.enabled = False
+    return bot
+
+
+def connect(latency: float = 0) -> FakeBot:
+    """在事件循环中注册 FakeBot 之后 nonebot.get_bot() 返回它"""
+    driver = nonebot.get_driver()
+    adapter = driver._adapters[Adapter.get_name()]
+    fake = FakeBot(adapter, SELF_ID, latency)
+    driver._bot_connect(fake)
+    return fake
+
+
+def to_event(data: dict):
+    """OneBot v11 事件数据转换为事件对象 与协议端上报的处理方式相同"""
+    return Adapter.json_to_event(data)
+
+
+class EventFactory:
+    """生成群聊 私聊 频道消息事件数据"""
+
+    def __init__(self, seed: int = 0, groups: int = 200, users: int = 2000, guilds: int = 20):
+        self.random = random.Random(seed)
+        self.groups = [100000 + i for i in range(groups)]
+        self.users = [200000 + i for i in range(users)]
+        self.guilds = [(300000 + i, 400000 + i) for i in range(guilds)]
+        self._message_id = itertools.count(1)
+
+    def message(self, text: str, kind: str = None, to_me: bool = False) -> dict:
+        kind = kind or self.random.choices(('group', 'private', 'guild'), (8, 1, 1))[0]
+        user_id = self.random.choice(self.users)
+        data = {
+            'time': int(time.time()),
+            'self_id': int(SELF_ID),
+            'post_type': 'message',
+            'message_id': next(self._message_id),
+            'user_id': user_id,
+            'message': f'[CQ:at,qq={SELF_ID}] {text}' if to_me and kind == 'group' else text,
+            'raw_message': text,
+            'font': 0,
+            'sender': {'user_id': user_id, 'nickname': f'user{user_id}'},
+        }
+        if kind == 'group':
+            data.update(
+                message_type='group', sub_type='normal', group_id=self.random.choice(self.groups),
+                anonymous=None,
+            )
+            data['sender']['role'] = self.random.choices(('member', 'admin', 'owner'), (20, 2, 1))[0]
+        elif kind == 'private':
+            data.update(message_type='private', sub_type='friend')
+        else:
+            guild_id, channel_id = self.random.choice(self.guilds)
+            data.update(
+                message_type='guild', sub_type='channel', guild_id=guild_id, channel_id=channel_id,
+                self_tiny_id=GUILD_TINY_ID, message_id=str(data['message_id']),
+            )
+            data['sender'] = {'user_id': user_id, 'nickname': f'user{user_id}'}
+            del data['font']
+        return data
+
+
+class StageRecorder:
+    """通过追踪监听器收集每条消息各阶段的耗时"""
+
+    def __init__(self):
+        self.stages: {str: list[float]} = defaultdict(list)
+
+    def __call__(self, root):
+        totals = defaultdict(float)
+        for _, span in root.walk():
+            totals[span.name] += span.duration
+        for name, duration in totals.items():
+            self.stages[name].append(duration)
+
+    def __enter__(self):
+        from kirabot import tracing
+        tracing.add_listener(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        from kirabot import tracing
+        tracing.remove_listener(self)
+        return False
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def pick(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': pick(0.5),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': samples[-1],
+    }
+
+
+async def measure_allocations(run, count: int) -> dict:
+    """以 tracemalloc 统计执行 run() count 次的平均内存分配"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(count):
+        await run()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return {'bytes_per_message': allocated / count, 'blocks_per_message': blocks / count}
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def save(result: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump(result, fp, ensure_ascii=False, indent=2)
+
+
+def compare(result: dict, path: str, tolerance: float = 0.1) -> bool:
+    """
+    与保存的基线比较并输出差异 吞吐下降或延迟上升超过 tolerance 时返回False
+    """
+    with open(path, 'r', encoding='utf-8') as fp:
+        baseline = json.load(fp)
+    ok = True
+    print(f'\nCompare with {path} ({baseline.get("environment", {}).get("time", "?")})')
+    rows = [('throughput', baseline['throughput'], result['throughput'], True)]
+    for stage, stats in result['stages'].items():
+        if stage in baseline['stages']:
+            rows.append((f'{stage}.p50', baseline['stages'][stage]['p50'], stats['p50'], False))
+            rows.append((f'{stage}.p99', baseline['stages'][stage]['p99'], stats['p99'], False))
+    if 'allocations' in baseline and 'allocations' in result:
+        rows.append(('bytes/msg', baseline['allocations']['bytes_per_message'],
+                     result['allocations']['bytes_per_message'], False))
+    for name, old, new, higher_better in rows:
+        change = (new - old) / old if old else 0
+        regressed = change < -tolerance if higher_better else change > tolerance
+        ok &= not regressed
+        print(f'{name:<24}{old:>14.6g}{new:>14.6g}{change:>+10.1%}{"  REGRESSED" if regressed else ""}')
+    return ok
+
+
+def report(result: dict):
+    print(f"\n{result['messages']} messages in {result['elapsed']:.2f}s: {result['throughput']:.0f} msg/s")
+    print(f"{'stage':<16}{'mean(ms)':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, stats in result['stages'].items():
+        print(f'{stage:<16}' + ''.join(f'{stats[k] * 1000:>10.3f}' for k in ('mean', 'p50', 'p95', 'p99', 'max')))
+    if 'allocations' in result:
+        allocations = result['allocations']
+        print(f"allocations: {allocations['bytes_per_message']:.0f} B/msg, "
+              f"{allocations['blocks_per_message']:.1f} blocks/msg")
@@ -0,0 +1,197 @@
+"""
+事件重放
+将 kirabot.recorder 记录的事件(RECORD_EVENTS)通过分发器重放到无网络的FakeBot
+
+在项目根目录运行:
+    python bench/replay.py log/events.ndjson --mode realtime
+    python bench/replay.py log/events.ndjson --mode accelerated --speedup 20 --streams 4
+    python bench/replay.py log/events.ndjson --mode fast --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+
+from nonebot.exception import FinishedException
+
+import harness
+
+# 第k路重放的群号 频道号 用户号加上 k*STREAM_OFFSET 使各路模拟不同的区域
+STREAM_OFFSET = 10 ** 10
+
+
+def load(path: str, limit: int = None) -> list[tuple[float, dict]]:
+    events = []
+    with open(path, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            events.append((record['t'], record['e']))
+            if limit and len(events) >= limit:
+                break
+    events.sort(key=lambda item: item[0])
+    return events
+
+
+def shift(data: dict, stream: int) -> dict:
+    if not stream:
+        return data
+    data = dict(data)
+    offset = stream * STREAM_OFFSET
+    for key in ('group_id', 'guild_id', 'channel_id', 'user_id'):
+        if isinstance(data.get(key), int):
+            data[key] += offset
+    if isinstance(data.get('message_id'), int):
+        data['message_id'] += offset
+    return data
+
+
+class Replayer:
+    def __init__(self, bot, mode: str, speedup: float, concurrency: int):
+        from kirabot import handle
+
+        self.bot = bot
+        self.speedup = {'realtime': 1, 'accelerated': speedup, 'fast': None}[mode]
+        self.processors = {
+            'message': handle.handle_message,
+            'notice': handle.handle_notice,
+            'request': handle.handle_request,
+        }
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.latency: {str: list[float]} = defaultdict(list)
+        self.lateness: list[float] = []
+        self.errors: {str: int} = defaultdict(int)
+        self.skipped = 0
+        self.tasks: set[asyncio.Task] = set()
+
+    async def stream(self, events: list[tuple[float, dict]], index: int, start: float):
+        origin = events[0][0]
+        for received, data in events:
+            if self.speedup:
+                due = start + (received - origin) / self.speedup
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.lateness.append(max(0.0, time.perf_counter() - due))
+            event = harness.to_event(shift(data, index))
+            processor = self.processors.get(getattr(event, 'post_type', None))
+            if processor is None:
+                self.skipped += 1
+                continue
+            await self.semaphore.acquire()
+            task = asyncio.create_task(self.dispatch(processor, event))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def dispatch(self, processor, event):
+        start = time.perf_counter()
+        try:
+            await processor(self.bot, event)
+        except FinishedException:
+            pass
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+        finally:
+            self.latency[event.post_type].append(time.perf_counter() - start)
+            self.semaphore.release()
+
+
+def module_results(before: dict) -> dict:
+    """由指标统计各模块的执行次数 错误数与延迟分布"""
+    from kirabot.metrics import function_total, module_seconds
+
+    modules = defaultdict(lambda: defaultdict(int))
+    for labels, value in function_total.values.items():
+        delta = value - before.get(labels, 0)
+        if delta:
+            module, status = labels[0], labels[3]
+            modules[module][status] += delta
+    return {
+        module: {'results': dict(results), 'latency': module_seconds.quantiles(module)}
+        for module, results in modules.items()
+    }
+
+
+async def run(args) -> dict:
+    from kirabot import handle
+    from kirabot.handler.outbox import outbox
+    from kirabot.metrics import function_total
+
+    bot = harness.connect(args.api_latency)
+    events = load(args.log, args.limit)
+    if not events:
+        raise SystemExit(f'No Events in {args.log}')
+    replayer = Replayer(bot, args.mode, args.speedup, args.concurrency)
+    before = dict(function_total.values)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(replayer.stream(events, i, start) for i in range(args.streams)))
+    while replayer.tasks or handle.passive_tasks or outbox.depth() or outbox.stats()['sending']:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in replayer.latency.values())
+    span = (events[-1][0] - events[0][0]) or 1
+    return {
+        'environment': harness.environment(),
+        'options': vars(args),
+        'events': total,
+        'skipped': replayer.skipped,
+        'recorded_span': span,
+        'elapsed': elapsed,
+        'throughput': total / elapsed,
+        'latency': {kind: harness.percentiles(values) for kind, values in replayer.latency.items()},
+        'lateness': harness.percentiles(replayer.lateness),
+        'errors': dict(replayer.errors),
+        'modules': module_results(before),
+        'api_calls': dict(bot.calls),
+        'send_queue': outbox.stats(),
+    }
+
+
+def report(result: dict):
+    print(f"\n{result['events']} events in {result['elapsed']:.2f}s "
+          f"(recorded over {result['recorded_span']:.0f}s): {result['throughput']:.0f} events/s")
+    print(f"{'type':<16}{'mean(ms)':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for kind, stats in [*result['latency'].items(), ('lateness', result['lateness'])]:
+        if stats:
+            print(f'{kind:<16}' + ''.join(f'{stats[k] * 1000:>10.3f}' for k in ('mean', 'p50', 'p95', 'p99', 'max')))
+    if result['errors']:
+        print(f"unhandled exceptions: {result['errors']}")
+    print(f"\n{'module':<24}{'ok':>8}{'error':>8}{'timeout':>8}{'rejected':>9}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for module, stats in sorted(result['modules'].items()):
+        results, latency = stats['results'], stats['latency']
+        print(f"{module:<24}" + ''.join(f'{results.get(k, 0):>8}' for k in ('ok', 'error', 'timeout'))
+              + f"{results.get('rejected', 0):>9}"
+              + f"{latency.get(0.5, 0) * 1000:>10.3f}{latency.get(0.99, 0) * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='KiraBot event replay')
+    parser.add_argument('log', help='RECORD_PATH 记录的事件文件')
+    parser.add_argument('--mode', choices=('realtime', 'accelerated', 'fast'), default='fast',
+                        help='realtime:按记录的间隔 accelerated:间隔除以speedup fast:不等待')
+    parser.add_argument('--speedup', type=float, default=10, help='accelerated模式的加速倍数')
+    parser.add_argument('--streams', type=int, default=1, help='同时重放的路数 每路使用不同的区域')
+    parser.add_argument('--concurrency', type=int, default=1000, help='同时处理的事件上限')
+    parser.add_argument('--limit', type=int, help='只重放前N个事件')
+    parser.add_argument('--api-latency', type=float, default=0, help='FakeBot每次API调用的延迟(秒)')
+    parser.add_argument('--no-modules', action='store_true', help='不加载内置模块与配置中启用的模块')
+    parser.add_argument('--save', help='保存结果')
+    args = parser.parse_args()
+
+    harness.boot(not args.no_modules)
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    report(result)
+    if args.save:
+        harness.save(result, args.save)
+        print(f'\nResult saved to {args.save}')
+    sys.exit(1 if result['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ from nonebot import Bot
 from nonebot.adapters import Event
 
 from kirabot import auth
+from kirabot.context import get_context
 from kirabot.handler import Module, set_module_status, loaded_modules, Service
 from kirabot.handler.module import get_module_help
 from kirabot.utils import get_area_id
@@ -74,7 +75,7 @@ async def module_show(bot: Bot, event: Event):
 
 @module_manager.at_message("prefix", ["帮助", "指南"], (1, 1, 1), True, True)
 async def module_help(bot: Bot, event: Event):
-    msg = str(event.get_message())
+    msg = get_context(event).message
     mod = re.sub(r'^(帮助)|(指南)', '', msg).strip().split('.')
     module_name = mod[0]
     service_name = mod[1] if len(mod) > 1 else None
@@ -8,7 +8,8 @@ import nonebot.log
 from nonebot.adapters.onebot.v11 import Adapter as ONEBOT_V11Adapter
 from nonebot.log import logger, default_format
 
-from . import config, format
+from . import auth, config, format, metrics, tracing, utils
+from .utils import browser, web
 from .format import NOT_INIT_ERROR, NOT_RUNNING_ERROR
 
 os.makedirs('./log/', exist_ok=True)
@@ -29,12 +30,18 @@ class KiraBot:
     def init(self, **kwargs):
         logger.add("./log/error.log", level="ERROR",
                    format=default_format, rotation="10MB")
+        tracing.setup()
         nonebot.init(**kwargs)
 
         self.app = nonebot.get_asgi()
+        if config.METRICS_PATH:
+            self.app.add_route(config.METRICS_PATH, metrics.endpoint)
         self.driver = nonebot.get_driver()
         self.driver.register_adapter(ONEBOT_V11Adapter)
         self.config = nonebot.config.Config
+        self.driver.on_startup(auth.auth_index.start)
+        self.driver.on_startup(web.client_pool.startup)
+        self.driver.on_startup(browser.startup)
 
         nonebot.load_plugin('nonebot_plugin_guild_patch')
         nonebot.load_plugin('nonebot_plugin_apscheduler')
@@ -43,7 +50,18 @@ class KiraBot:
                 nonebot.load_plugin(f'built-in.{built_in_module}')
             except Exception as e:
                 nonebot.logger.exception(e)
-        importlib.import_module(".handle", package="kirabot")
+        handle = importlib.import_module(".handle", package="kirabot")
+        from .handler.outbox import outbox
+        from .recorder import recorder
+        # 关闭时按注册顺序执行 先结束仍在执行的功能与待发送的消息 再释放它们使用的资源
+        self.driver.on_shutdown(handle.drain_passive)
+        self.driver.on_shutdown(outbox.shutdown)
+        self.driver.on_shutdown(recorder.close)
+        self.driver.on_shutdown(auth.auth_index.stop)
+        self.driver.on_shutdown(browser.shutdown)
+        self.driver.on_shutdown(web.client_pool.shutdown)
+        self.driver.on_shutdown(config.config_store.close)
+        self.driver.on_shutdown(utils.data_store.close)
         for module_name in config.MODULES_ON:
             try:
                 self.load_plugin(module_name)
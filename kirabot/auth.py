@@ -1,9 +1,14 @@
+import asyncio
 import datetime
+import heapq
+import time
 
 from nonebot.adapters import Event
+from nonebot.log import logger
 
-from .config import SUPERUSERS, get_config, update_config
-from .utils import get_area_id
+from .config import SUPERUSERS, AUTH_EXPIRE_INTERVAL, PERMISSION_CACHE_TTL, PERMISSION_CACHE_SIZE, get_config, \
+    update_config, update_config_item, delete_config_item, get_config_version
+from .context import get_context
 
 BLACK = BLOCK = 0
 BLOCKED_FIELD = 5
@@ -16,40 +21,144 @@ WHITE = ALLOW = 50
 SU = SUPERUSER = 100
 
 
+class AuthIndex:
+    """
+    白名单与黑名单的内存索引
+    权限检查只查询字典 不读写配置
+    黑名单的解除时间另存于最小堆 由后台任务到期后批量移除并写回配置
+    被关闭的区域按条目保存在 auth.area_block 下 开关一个区域只写入一个条目
+    配置被 update_config 替换或从存储重新加载后 在下一次查询时重建
+    """
+
+    def __init__(self):
+        self.white: {str: bool} = {}
+        self.block: {str: float} = {}
+        self.area_block: set[str] = set()
+        self._expiry: list[tuple[float, str]] = []
+        self._version: int | None = None
+        self._task: asyncio.Task | None = None
+
+    def load(self):
+        self._version = get_config_version('auth')
+        self.white = {str(user_id): status for user_id, status in get_config('auth', 'white').items()}
+        self.block = {str(user_id): until for user_id, until in get_config('auth', 'block').items()}
+        self._expiry = [(until, user_id) for user_id, until in self.block.items()]
+        heapq.heapify(self._expiry)
+        self.area_block = set(get_config('auth', 'area_block'))
+        legacy_area = get_config('auth', 'area')
+        if legacy_area.get('block'):
+            # 旧版本以列表保存在 auth.area.block 下 转换为条目
+            for area_id in legacy_area['block']:
+                self.set_area_block(area_id, True)
+            update_config({k: v for k, v in legacy_area.items() if k != 'block'}, 'auth', 'area')
+        permission_cache.invalidate()
+
+    def ensure_loaded(self):
+        if self._version != get_config_version('auth'):
+            self.load()
+
+    def is_white(self, user_id: str) -> bool:
+        self.ensure_loaded()
+        return bool(self.white.get(user_id))
+
+    def is_blocked(self, user_id: str) -> bool:
+        self.ensure_loaded()
+        until = self.block.get(user_id)
+        # 已到期但尚未被后台任务移除的记录同样视为已解除
+        return until is not None and time.time() <= until
+
+    def set_white(self, user_id: str, status: bool):
+        self.ensure_loaded()
+        self.white[user_id] = status
+        update_config_item(status, 'auth', 'white', user_id)
+
+    def set_block(self, user_id: str, until: float):
+        self.ensure_loaded()
+        self.block[user_id] = until
+        heapq.heappush(self._expiry, (until, user_id))
+        update_config_item(until, 'auth', 'block', user_id)
+
+    def is_area_blocked(self, area_id: str) -> bool:
+        self.ensure_loaded()
+        return area_id in self.area_block
+
+    def set_area_block(self, area_id: str, blocked: bool):
+        if blocked:
+            self.area_block.add(area_id)
+            update_config_item(True, 'auth', 'area_block', area_id)
+        else:
+            self.area_block.discard(area_id)
+            delete_config_item('auth', 'area_block', area_id)
+
+    def expire(self, now: float = None) -> int:
+        """
+        移除所有已到期的黑名单记录 返回移除数量
+        """
+        self.ensure_loaded()
+        now = now or time.time()
+        expired = 0
+        while self._expiry and self._expiry[0][0] < now:
+            until, user_id = heapq.heappop(self._expiry)
+            if self.block.get(user_id) != until:
+                continue  # 已被重新设置 堆中为过时记录
+            del self.block[user_id]
+            delete_config_item('auth', 'block', user_id)
+            expired += 1
+        return expired
+
+    async def run(self):
+        while True:
+            delay = AUTH_EXPIRE_INTERVAL
+            if self._expiry:
+                delay = min(delay, max(self._expiry[0][0] - time.time(), 0) + 1)
+            await asyncio.sleep(delay)
+            try:
+                if expired := self.expire():
+                    logger.info(f'{expired} Blocked Users Expired')
+            except Exception as e:
+                logger.exception(e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+auth_index = AuthIndex()
+
+
 class EventAuth:
     def __init__(self, event: Event):
         self.event = event
-        self.event_dict = event.dict()
-        self.user_id = str(self.event.get_user_id())
-        self.self_id = self.event_dict['self_id']
-        self.area_id = get_area_id(event)
+        self.context = get_context(event)
+        self.user_id = self.context.user_id
+        self.self_id = self.context.self_id
+        self.area_id = self.context.area_id
+
+    @property
+    def event_dict(self) -> dict:
+        return self.context.event_dict
 
     def get_user_permission(self):
 
         if str(self.user_id) in SUPERUSERS:
             return SU
 
-        whitelist = get_config('auth', 'white')
-        if whitelist:
-            if str(self.user_id) in whitelist:
-                if whitelist[self.user_id]:
-                    return WHITE
-
-        blocklist = get_config('auth', 'block')
-        if blocklist:
-            if self.user_id in blocklist:
-                now = int(datetime.datetime.now().timestamp())
-                if now > blocklist[self.user_id]:
-                    del blocklist[self.user_id]
-                    update_config(blocklist, 'auth', 'block')
-                else:
-                    return BLOCK
+        if auth_index.is_white(self.user_id):
+            return WHITE
 
-        if self.event_dict['post_type'] == 'message':
+        if auth_index.is_blocked(self.user_id):
+            return BLOCK
+
+        if self.context.post_type == 'message':
             if self.area_id.startswith('u'):
                 return PRIVATE
             elif self.area_id.startswith('g'):
-                role = self.event_dict['sender']['role']
+                role = self.context.sender_role
                 if role == 'owner':
                     return OWNER
                 elif role == 'admin':
@@ -67,35 +176,100 @@ class EventAuth:
     def set_block_user(self, td: datetime.timedelta, user_id: int = None):
         now = datetime.datetime.now()
         block_time = now + td
-        blocklist = get_config('auth', 'block')
-        blocklist[user_id or self.user_id] = (block_time.timestamp())
-        update_config(blocklist, 'auth', 'block')
+        auth_index.set_block(str(user_id or self.user_id), block_time.timestamp())
+        permission_cache.invalidate(user_id=str(user_id or self.user_id))
 
     def set_white_user(self, status: bool = True, user_id: int = None):
-        whitelist = get_config('auth', 'white')
-        whitelist[user_id or self.user_id] = status
-        update_config(whitelist, 'auth', 'white')
+        auth_index.set_white(str(user_id or self.user_id), status)
+        permission_cache.invalidate(user_id=str(user_id or self.user_id))
 
     def get_area_availability(self):
-        auth_area = get_config('auth', 'area')
-        if 'block' in auth_area:
-            return BLOCK if self.area_id in auth_area['block'] else NORMAL
+        return BLOCK if auth_index.is_area_blocked(self.area_id) else NORMAL
 
     def set_filed_availability(self, able: bool):
-        auth_area = get_config('auth', 'area')
-        if 'block' not in auth_area:
-            auth_area['block'] = []
+        permission_cache.invalidate(area_id=self.area_id)
+        blocked = auth_index.is_area_blocked(self.area_id)
         if able:
-            if self.area_id in auth_area['block']:
-                auth_area['block'].remove(self.area_id)
-                update_config(auth_area, 'auth', 'area')
+            if blocked:
+                auth_index.set_area_block(self.area_id, False)
                 return WHITE
             else:
                 return BLACK
         else:
-            if self.area_id in auth_area['block']:
+            if blocked:
                 return BLACK
             else:
-                auth_area['block'].append(self.area_id)
-                update_config(auth_area, 'auth', 'area')
+                auth_index.set_area_block(self.area_id, True)
                 return WHITE
+
+
+class PermissionCache:
+    """
+    权限缓存
+    以 (用户id, 区域id, 身份) 为键 在有效期内复用 get_user_permission 的结果
+    黑名单/白名单/区域状态/超级用户变化时需主动失效
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        """
+        ttl: 有效期(秒) 为0时不缓存
+        max_size: 超过该数量时清理已过期的记录
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: {tuple: tuple[int, float]} = {}
+
+    def get(self, event_auth: EventAuth) -> int:
+        auth_index.ensure_loaded()  # 配置已改变时重建索引并清空缓存
+        key = (event_auth.user_id, event_auth.area_id, event_auth.context.sender_role)
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry and entry[1] > now:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        permission = event_auth.get_user_permission()
+        if self.ttl > 0:
+            expires = now + self.ttl
+            if permission == BLOCK and event_auth.user_id in auth_index.block:
+                # 不要把黑名单缓存到解除之后
+                expires = min(expires, now + auth_index.block[event_auth.user_id] - time.time())
+            if len(self._cache) >= self.max_size:
+                self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+            self._cache[key] = (permission, expires)
+        return permission
+
+    def invalidate(self, user_id: str = None, area_id: str = None):
+        """
+        失效指定用户或区域的记录 均为None时全部失效
+        """
+        if user_id is None and area_id is None:
+            self._cache.clear()
+            return
+        for key in list(self._cache):
+            if (user_id is None or key[0] == user_id) and (area_id is None or key[1] == area_id):
+                del self._cache[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0,
+            'size': len(self._cache),
+        }
+
+
+permission_cache = PermissionCache(PERMISSION_CACHE_TTL, PERMISSION_CACHE_SIZE)
+
+
+def get_permission(event: Event) -> int:
+    """
+    获取事件发送者的权限值 同一事件只计算一次 跨事件在有效期内复用
+    """
+    context = get_context(event)
+    if context.permission is None:
+        context.permission = permission_cache.get(EventAuth(event))
+    return context.permission
@@ -1,9 +1,12 @@
 import importlib
-import json
+import os
 
 import nonebot
 
+from ._default import *
 from .__bot__ import *
+from .storage import create_storage
+from .store import ConfigStore
 
 # load handler configs
 
@@ -19,32 +22,52 @@ if not os.path.exists(json_config_data):
     os.mkdir(json_config_data)
 
 
+sqlite_path = STORAGE_SQLITE_PATH or os.path.join(json_config_data, 'kirabot.db')
+
+
+def create_store(namespace: str, root: str, indent: int = 4) -> ConfigStore:
+    """
+    按 STORAGE_ENGINE 创建存储
+    namespace: SQLite中的命名空间 root: json文件目录
+    """
+    engine = create_storage(STORAGE_ENGINE, namespace, root, sqlite_path, indent)
+    return ConfigStore(engine, CONFIG_FLUSH_INTERVAL, CONFIG_WATCH_INTERVAL)
+
+
+config_store = create_store('config', json_config_data)
+
+
 def get_config(key: str, subkey: str = None):
-    path = json_config_data + f'{key}.json'
-    if os.path.exists(path):
-        data = json.load(open(path, 'r', encoding='utf-8'))
-        if subkey:
-            if subkey in data:
-                return data[subkey]
-            else:
-                return {}
-        else:
-            return data
-    else:
-        return {}
+    """
+    读取配置 数据常驻内存
+    返回的对象与缓存共享 修改后需调用update_config保存
+    """
+    return config_store.get(key, subkey)
+
+
+def get_config_version(key: str) -> int:
+    """
+    配置的版本 update_config替换配置或从存储重新加载后改变
+    """
+    return config_store.version(key)
 
 
 def update_config(udata, key: str, subkey: str = None):
-    path = json_config_data + f'{key}.json'
-    if os.path.exists(path):
-        data = json.load(open(path, 'r', encoding='utf-8'))
-        if subkey:
-            data[subkey] = udata
-        else:
-            data = udata
-        with open(path, 'w', encoding='utf-8') as fp:
-            json.dump(data, fp, ensure_ascii=False, indent=4)
-    else:
-        data = {subkey: udata}
-        with open(path, 'w', encoding='utf-8') as fp:
-            json.dump(data, fp, ensure_ascii=False, indent=4)
+    """
+    更新配置 立即对get_config可见 稍后由后台线程写回
+    """
+    config_store.update(udata, key, subkey)
+
+
+def update_config_item(value, key: str, subkey: str, item: str):
+    """
+    更新配置中 subkey 下的单个条目 SQLite存储下仅写入一行
+    """
+    config_store.update_item(value, key, subkey, item)
+
+
+def delete_config_item(key: str, subkey: str, item: str):
+    """
+    删除配置中 subkey 下的单个条目
+    """
+    config_store.delete_item(key, subkey, item)
@@ -0,0 +1,108 @@
+# 默认配置 可在 __bot__.py 中覆盖
+
+# 配置写回磁盘的去抖间隔(秒) 期间的多次修改合并为一次写入
+CONFIG_FLUSH_INTERVAL = 2
+# 检查配置文件是否被外部修改的间隔(秒) 为0时不检查
+CONFIG_WATCH_INTERVAL = 0
+
+# 存储引擎 'json': 每个key一个json文件 'sqlite': SQLite数据库(WAL模式)
+STORAGE_ENGINE = 'json'
+# SQLite数据库路径 为None时使用 kirabot/config/data/kirabot.db
+STORAGE_SQLITE_PATH = None
+
+# 清理到期黑名单记录的最长间隔(秒)
+AUTH_EXPIRE_INTERVAL = 60
+
+# 权限缓存有效期(秒) 为0时不缓存
+PERMISSION_CACHE_TTL = 30
+# 权限缓存记录数上限 超过时清理过期记录
+PERMISSION_CACHE_SIZE = 10000
+
+# 共享HTTP客户端的连接上限
+WEB_MAX_CONNECTIONS = 100
+# 保持连接(keep-alive)的空闲连接上限与过期时间(秒)
+WEB_MAX_KEEPALIVE = 20
+WEB_KEEPALIVE_EXPIRY = 30
+# 对同一主机的并发请求上限
+WEB_HOST_CONNECTIONS = 10
+# 安装h2时启用HTTP/2
+WEB_HTTP2 = True
+
+# 请求失败时的最多请求次数(含第一次) 第一次重试前的等待时间与单次等待上限(秒)
+WEB_RETRY_ATTEMPTS = 3
+WEB_RETRY_BACKOFF = 0.5
+WEB_RETRY_MAX_BACKOFF = 10
+
+# HTTP响应缓存(async_get_json/async_get_content 指定cache_ttl时使用) 内存占用上限(字节)
+WEB_CACHE_MEMORY_BYTES = 32 * 1024 * 1024
+# 是否同时缓存到 RESOURCE/cache/web 及其大小上限(字节)
+WEB_CACHE_DISK = False
+WEB_CACHE_DISK_BYTES = 256 * 1024 * 1024
+
+# 合并相同的并发GET/HEAD请求
+WEB_SINGLE_FLIGHT = True
+
+# 同时进行的流式下载数 与每次写入的块大小(字节)
+WEB_DOWNLOAD_CONCURRENCY = 4
+WEB_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 浏览器池 每个池(使用/不使用代理)保留的浏览器数 单个浏览器使用多少次后重启 等待空闲浏览器的超时(秒)
+BROWSER_POOL_SIZE = 2
+BROWSER_MAX_USES = 50
+BROWSER_LEASE_TIMEOUT = 30
+# 启动时预先启动不使用代理的浏览器
+BROWSER_POOL_WARM = False
+
+# 渲染结果缓存(RESOURCE/cache/render) 总大小上限(字节) 与默认有效期(秒)
+RENDER_CACHE_BYTES = 128 * 1024 * 1024
+RENDER_CACHE_TTL = 60
+# 文件路径返回后至少保留的时间(秒) 避免等待发送的消息引用的文件被清理
+RENDER_CACHE_MIN_AGE = 300
+
+# 异步图片编码(async_pic2b64/async_pic2cq) 线程数 超出后改用有损格式的大小预算(字节)
+IMAGE_ENCODE_WORKERS = 2
+IMAGE_SIZE_BUDGET = 4 * 1024 * 1024
+# 编码结果超过此大小时写入 RESOURCE/cache/image 并发送文件路径(字节)
+IMAGE_FILE_THRESHOLD = 1024 * 1024
+# base64编码结果的内存缓存大小上限(字节)
+IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+# RESOURCE/cache/image 中大图文件的总大小上限(字节)
+IMAGE_FILE_CACHE_BYTES = 256 * 1024 * 1024
+
+# 全局发送限速 每秒发送消息数 与允许的突发数
+SEND_RATE = 5
+SEND_BURST = 10
+
+# 广播 同时发送的区域数
+BROADCAST_CONCURRENCY = 4
+
+# 发送队列 同一区域两次发送的最小间隔(秒 为0时只受全局限速约束) ActionFailed的重试次数与第一次重试前的等待(秒)
+SEND_AREA_INTERVAL = 0
+SEND_RETRY = 2
+SEND_RETRY_BACKOFF = 1
+
+# 非主动功能的执行方式 'sequential':按触发顺序依次等待执行 finish会结束本次处理
+# 'concurrent':作为独立任务并发执行 不阻塞主动功能的回复 执行顺序不确定 finish只结束该功能
+PASSIVE_DISPATCH = 'sequential'
+# 同时执行的非主动功能数 与关闭时等待其结束的时间(秒)
+PASSIVE_CONCURRENCY = 64
+PASSIVE_DRAIN_TIMEOUT = 10
+# 等待执行与执行中的非主动功能数上限 超出后丢弃新触发的非主动功能
+PASSIVE_MAX_PENDING = 1024
+
+# 指标导出路径 为None时不导出 与计算分位数使用的最近样本数
+# 导出的接口挂载在bot的ASGI应用上且不验证身份 仅在可信网络中开启 如 '/metrics'
+METRICS_PATH = None
+METRICS_WINDOW = 1024
+
+# 消息处理追踪 每条消息都记录各阶段耗时
+# 按采样比例(0~1)将完整追踪写入 TRACE_LOG 为0时只写入慢请求
+TRACE_SAMPLE_RATE = 0
+# 处理时间超过此值(秒)的追踪无论是否被采样都写入 TRACE_LOG 为None时不检查 采样比例也为0时关闭追踪
+TRACE_SLOW_THRESHOLD = 1
+TRACE_LOG = './log/trace.log'
+
+# 记录收到的事件 供 bench/replay.py 重放 单个文件的大小上限(字节)
+RECORD_EVENTS = False
+RECORD_PATH = './log/events.ndjson'
+RECORD_MAX_BYTES = 256 * 1024 * 1024
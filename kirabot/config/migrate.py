@@ -0,0 +1,21 @@
+"""
+将json文件中的配置与数据导入SQLite存储
+用法: python -m kirabot.config.migrate
+导入后在 __bot__.py 中设置 STORAGE_ENGINE = 'sqlite'
+"""
+from nonebot.log import logger
+
+from . import json_config_data, sqlite_path, RESOURCE
+from .storage import JsonStorage, SqliteStorage
+
+
+def migrate():
+    for namespace, root in (('config', json_config_data), ('data', RESOURCE + '/data/')):
+        storage = SqliteStorage(sqlite_path, namespace)
+        count = storage.import_json(JsonStorage(root))
+        storage.close()
+        logger.info(f'Imported {count} Documents From {root} Into {sqlite_path} ({namespace})')
+
+
+if __name__ == '__main__':
+    migrate()
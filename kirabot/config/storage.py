@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+
+from nonebot.log import logger
+
+# 写入操作: (路径, 快照) 路径为 () 整个文档 / (subkey,) / (subkey, item)
+# 快照为json字符串 为DELETE时表示删除
+# DELETE不与任何json值相同 值为None(null)的条目照常写入
+DELETE = object()
+
+
+class JsonStorage:
+    """
+    json文件存储 每个key一个文件
+    """
+
+    # 写回时需要整个文档的快照
+    whole_document = True
+
+    def __init__(self, root: str, indent: int = 4):
+        self.root = root
+        self.indent = indent
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, f'{key}.json')
+
+    def mtime(self, key: str) -> float | None:
+        try:
+            return os.path.getmtime(self.path(key))
+        except OSError:
+            return None
+
+    def load(self, key: str, quarantine: bool = True):
+        """
+        quarantine: 文件损坏时改名保存并返回None 为False时抛出异常且不改动文件
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as fp:
+                return json.load(fp)
+        except json.JSONDecodeError:
+            if not quarantine:
+                raise
+            # 保留损坏的文件以便手动恢复
+            os.replace(path, f'{path}.corrupted')
+            logger.error(f'Corrupted Json File {path} Moved to {path}.corrupted')
+            return None
+
+    def apply(self, key: str, operations: list):
+        """
+        json文件每次重写整个文档 只接受整个文档的快照
+        由 ConfigStore 在写回时提供内存中的完整文档 不依赖磁盘上已有的内容
+        """
+        path, snapshot = operations[-1]
+        if path:
+            raise ValueError(f'JsonStorage Requires Whole Document Snapshot for {key}')
+        self.write(key, json.loads(snapshot))
+
+    def write(self, key: str, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, ensure_ascii=False, indent=self.indent)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp_path, path)
+
+    def keys(self) -> list[str]:
+        keys = []
+        for parent, _, files in os.walk(self.root):
+            for file in files:
+                if file.endswith('.json'):
+                    relative = os.path.relpath(os.path.join(parent, file), self.root)
+                    keys.append(relative.removesuffix('.json').replace(os.sep, '/'))
+        return keys
+
+
+class SqliteStorage:
+    """
+    SQLite存储(WAL模式)
+    字典文档按 key / subkey / item 三层拆分为行
+    修改单个用户或区域只需更新一行 不必重写整个文档
+    """
+
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS kira_doc (
+        ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+        PRIMARY KEY (ns, key)
+    );
+    CREATE TABLE IF NOT EXISTS kira_sub (
+        ns TEXT NOT NULL, key TEXT NOT NULL, subkey TEXT NOT NULL, value TEXT NOT NULL,
+        PRIMARY KEY (ns, key, subkey)
+    );
+    CREATE TABLE IF NOT EXISTS kira_item (
+        ns TEXT NOT NULL, key TEXT NOT NULL, subkey TEXT NOT NULL, item TEXT NOT NULL, value TEXT NOT NULL,
+        PRIMARY KEY (ns, key, subkey, item)
+    );
+    '''
+    # 字典在上层行中只记录占位符 内容存放在下一层的行中
+    MARKER = '{}'
+    # 只写回被修改的行
+    whole_document = False
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.ns = namespace
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.realpath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+
+    def mtime(self, key: str) -> None:
+        return None
+
+    def load(self, key: str, quarantine: bool = True):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM kira_doc WHERE ns=? AND key=?', (self.ns, key)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            if not isinstance(data, dict):
+                return data
+            subs = self._conn.execute(
+                'SELECT subkey, value FROM kira_sub WHERE ns=? AND key=?', (self.ns, key)).fetchall()
+            items = self._conn.execute(
+                'SELECT subkey, item, value FROM kira_item WHERE ns=? AND key=?', (self.ns, key)).fetchall()
+        for subkey, value in subs:
+            data[subkey] = json.loads(value)
+        for subkey, item, value in items:
+            target = data.setdefault(subkey, {})
+            if isinstance(target, dict):
+                target[item] = json.loads(value)
+        return data
+
+    def apply(self, key: str, operations: list):
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute('BEGIN')
+            try:
+                for path, snapshot in operations:
+                    if not path:
+                        self._delete_doc(cursor, key)
+                        if snapshot is not DELETE:
+                            self._write_doc(cursor, key, json.loads(snapshot))
+                    elif len(path) == 1:
+                        self._ensure_doc(cursor, key)
+                        self._delete_sub(cursor, key, path[0])
+                        if snapshot is not DELETE:
+                            self._write_sub(cursor, key, path[0], json.loads(snapshot))
+                    else:
+                        subkey, item = path
+                        if snapshot is DELETE:
+                            cursor.execute('DELETE FROM kira_item WHERE ns=? AND key=? AND subkey=? AND item=?',
+                                           (self.ns, key, subkey, str(item)))
+                        else:
+                            self._ensure_doc(cursor, key)
+                            cursor.execute('INSERT OR IGNORE INTO kira_sub VALUES (?, ?, ?, ?)',
+                                           (self.ns, key, subkey, self.MARKER))
+                            cursor.execute('INSERT OR REPLACE INTO kira_item VALUES (?, ?, ?, ?, ?)',
+                                           (self.ns, key, subkey, str(item), snapshot))
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT key FROM kira_doc WHERE ns=?', (self.ns,)).fetchall()
+        return [row[0] for row in rows]
+
+    def import_json(self, storage: JsonStorage) -> int:
+        """
+        导入json文件存储中的全部文档 返回导入的文档数
+        """
+        count = 0
+        for key in storage.keys():
+            data = storage.load(key)
+            if data is None:
+                continue
+            self.apply(key, [((), json.dumps(data, ensure_ascii=False))])
+            count += 1
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _ensure_doc(self, cursor, key):
+        cursor.execute('INSERT OR IGNORE INTO kira_doc VALUES (?, ?, ?)', (self.ns, key, self.MARKER))
+
+    def _delete_doc(self, cursor, key):
+        for table in ('kira_doc', 'kira_sub', 'kira_item'):
+            cursor.execute(f'DELETE FROM {table} WHERE ns=? AND key=?', (self.ns, key))
+
+    def _delete_sub(self, cursor, key, subkey):
+        for table in ('kira_sub', 'kira_item'):
+            cursor.execute(f'DELETE FROM {table} WHERE ns=? AND key=? AND subkey=?', (self.ns, key, subkey))
+
+    def _write_doc(self, cursor, key, data):
+        if isinstance(data, dict):
+            cursor.execute('INSERT INTO kira_doc VALUES (?, ?, ?)', (self.ns, key, self.MARKER))
+            for subkey, value in data.items():
+                self._write_sub(cursor, key, str(subkey), value)
+        else:
+            cursor.execute('INSERT INTO kira_doc VALUES (?, ?, ?)',
+                           (self.ns, key, json.dumps(data, ensure_ascii=False)))
+
+    def _write_sub(self, cursor, key, subkey, value):
+        if isinstance(value, dict):
+            cursor.execute('INSERT INTO kira_sub VALUES (?, ?, ?, ?)', (self.ns, key, subkey, self.MARKER))
+            cursor.executemany('INSERT INTO kira_item VALUES (?, ?, ?, ?, ?)', [
+                (self.ns, key, subkey, str(item), json.dumps(item_value, ensure_ascii=False))
+                for item, item_value in value.items()
+            ])
+        else:
+            cursor.execute('INSERT INTO kira_sub VALUES (?, ?, ?, ?)',
+                           (self.ns, key, subkey, json.dumps(value, ensure_ascii=False)))
+
+
+def create_storage(engine: str, namespace: str, root: str, sqlite_path: str, indent: int = 4):
+    """
+    按配置创建存储引擎
+    engine: 'json' 或 'sqlite'
+    """
+    if engine == 'sqlite':
+        return SqliteStorage(sqlite_path, namespace)
+    elif engine == 'json':
+        return JsonStorage(root, indent)
+    else:
+        raise ValueError(f'Unknown Storage Engine {engine}')
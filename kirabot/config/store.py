@@ -0,0 +1,220 @@
+import asyncio
+import atexit
+import json
+import threading
+
+from nonebot.log import logger
+
+from .storage import DELETE, JsonStorage, SqliteStorage
+
+
+class ConfigStore:
+    """
+    配置存储
+    每个key对应的文档在首次读取后常驻内存 读取不再访问存储引擎
+    写入只修改内存并记录被修改部分的快照 由后台线程去抖后交给存储引擎批量写回
+    需要整个文档的存储引擎(json) 写入时只标记文档 每个去抖周期在写入方的线程中取得一次快照
+    """
+
+    def __init__(self, engine: JsonStorage | SqliteStorage, flush_interval: float = 2, watch_interval: float = 0):
+        """
+        Args:
+            engine: 存储引擎
+            flush_interval: 写回去抖间隔(秒)
+            watch_interval: 检查存储被外部修改的间隔(秒) 为0时不检查
+        """
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.watch_interval = watch_interval
+        self._docs: {str: dict} = {}
+        self._mtimes: {str: float} = {}
+        self._versions: {str: int} = {}  # 文档被替换或重新加载的次数
+        self._pending: {str: {tuple: str}} = {}
+        self._dirty: set[str] = set()  # 已修改 尚未取得快照的文档
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        atexit.register(self.close)
+        if self.watch_interval:
+            self._start()
+
+    def document(self, key: str) -> dict:
+        data = self._docs.get(key)
+        if data is None:
+            data = self._read(key)
+            self._docs[key] = data
+        return data
+
+    def get(self, key: str, subkey: str = None):
+        data = self.document(key)
+        if subkey:
+            return data.get(subkey, {})
+        return data
+
+    def version(self, key: str) -> int:
+        """
+        文档整体或 subkey 被替换 以及从存储重新加载时改变
+        依赖文档内容建立索引的调用方据此判断索引是否过期
+        """
+        return self._versions.get(key, 0)
+
+    def update(self, udata, key: str, subkey: str = None):
+        with self._cond:
+            if subkey:
+                self.document(key)[subkey] = udata
+                self._record(key, (subkey,), udata)
+            else:
+                self._docs[key] = udata
+                self._record(key, (), udata)
+            self._versions[key] = self.version(key) + 1
+        self._start()
+
+    def update_item(self, value, key: str, subkey: str, item: str):
+        """修改文档中 subkey 下的单个条目"""
+        item = str(item)
+        with self._cond:
+            data = self.document(key)
+            if not isinstance(data.get(subkey), dict):
+                data[subkey] = {}
+                self._record(key, (subkey,), {})
+            data[subkey][item] = value
+            self._record(key, (subkey, item), value)
+        self._start()
+
+    def delete_item(self, key: str, subkey: str, item: str):
+        """删除文档中 subkey 下的单个条目"""
+        item = str(item)
+        with self._cond:
+            target = self.document(key).get(subkey)
+            if not isinstance(target, dict) or item not in target:
+                return
+            del target[item]
+            self._record_delete(key, (subkey, item))
+        self._start()
+
+    def flush(self):
+        """将所有待写入的修改立即写回"""
+        with self._write_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            for key, operations in pending.items():
+                try:
+                    self.engine.apply(key, list(operations.items()))
+                    self._mtimes[key] = self.engine.mtime(key)
+                except Exception as e:
+                    logger.error(f'Failed to Save Config {key}: {e}')
+                    with self._cond:
+                        # 失败的修改放回队列 其后产生的新修改仍然生效
+                        newer = self._pending.pop(key, {})
+                        for path, snapshot in newer.items():
+                            _merge(operations, path, snapshot)
+                        self._pending[key] = operations
+
+    def reload_changed(self):
+        """重新加载被外部修改的文档 有未写入修改的文档除外"""
+        for key in list(self._docs):
+            with self._cond:
+                if key in self._pending or key in self._dirty:
+                    continue
+            mtime = self.engine.mtime(key)
+            if mtime is None or mtime == self._mtimes.get(key):
+                continue
+            try:
+                # 文件可能正被外部写入 读取失败时保留内存中的文档 不改动文件 下次检查时重试
+                data = self.engine.load(key, quarantine=False)
+            except Exception as e:
+                logger.error(f'Failed to Reload Config {key}: {e}')
+                continue
+            if data is None:
+                continue
+            with self._cond:
+                # 读取期间产生的修改比磁盘上的内容新 放弃这次重新加载
+                if key in self._pending or key in self._dirty:
+                    continue
+                self._docs[key] = data
+                self._mtimes[key] = mtime
+                self._versions[key] = self.version(key) + 1
+            logger.info(f'Config {key} Reloaded')
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        for key in list(self._dirty):
+            self._snapshot(key)
+        self.flush()
+
+    def _record(self, key: str, path: tuple, value):
+        if self.engine.whole_document:
+            # 写回完整文档的快照 磁盘上的文件缺失或损坏时也不会丢失内存中的内容
+            # 快照推迟到去抖周期结束时在事件循环中取得 连续的修改只序列化一次
+            if key in self._dirty:
+                return
+            self._dirty.add(key)
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._snapshot(key)  # 不在事件循环中 立即取得快照
+            else:
+                loop.call_later(self.flush_interval, self._snapshot, key)
+            return
+        # 立即序列化快照 后台线程写入时不会与事件循环中的修改相互干扰
+        _merge(self._pending.setdefault(key, {}), path, json.dumps(value, ensure_ascii=False))
+        if len(self._pending) == 1:
+            self._cond.notify()
+
+    def _snapshot(self, key: str):
+        with self._cond:
+            if key not in self._dirty:
+                return  # 已由 close 取得
+            self._dirty.discard(key)
+            try:
+                self._pending[key] = {(): json.dumps(self._docs[key], ensure_ascii=False)}
+            except Exception as e:
+                logger.error(f'Failed to Serialize Config {key}: {e}')
+                return
+            if len(self._pending) == 1:
+                self._cond.notify()
+
+    def _record_delete(self, key: str, path: tuple):
+        if self.engine.whole_document:
+            self._record(key, path, None)  # 整个文档的快照中已不含被删除的条目
+            return
+        _merge(self._pending.setdefault(key, {}), path, DELETE)
+        if len(self._pending) == 1:
+            self._cond.notify()
+
+    def _read(self, key: str):
+        self._mtimes[key] = self.engine.mtime(key)
+        data = self.engine.load(key)
+        return {} if data is None else data
+
+    def _start(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name='ConfigStore', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(self.watch_interval or None)
+                if self._pending and not self._closed:
+                    # 去抖 等待期间的修改会被合并到同一次写入
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+            if self.watch_interval:
+                self.reload_changed()
+
+
+def _merge(operations: {tuple: str}, path: tuple, snapshot: str):
+    for recorded in list(operations):
+        if recorded[:len(path)] == path:
+            del operations[recorded]  # 被新的修改覆盖
+    operations[path] = snapshot
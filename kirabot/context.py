@@ -0,0 +1,78 @@
+import weakref
+from functools import cached_property
+
+from nonebot.adapters import Event
+
+
+class EventContext:
+    """
+    事件分发上下文
+    消息文本 区域id 用户id等在首次访问时计算并缓存
+    同一事件在触发器 权限 服务检查与日志中共用 避免重复转换和序列化事件
+    """
+
+    def __init__(self, event: Event):
+        self._event = weakref.ref(event)  # 上下文不延长事件的生命周期
+        self.permission: int | None = None  # 由 auth.get_permission 填充
+
+    @property
+    def event(self) -> Event | None:
+        return self._event()
+
+    @cached_property
+    def message(self) -> str:
+        """消息的字符串形式 即 str(event.get_message())"""
+        return str(self.event.get_message())
+
+    @cached_property
+    def area_id(self) -> str:
+        event = self.event
+        message_type = getattr(event, 'message_type', None)
+        if message_type == 'group':
+            return f"g{event.group_id}"
+        elif message_type == 'guild':
+            return f'c{event.guild_id}-{event.channel_id}'
+        else:
+            return f'u{event.user_id}'
+
+    @cached_property
+    def user_id(self) -> str:
+        return str(self.event.get_user_id())
+
+    @cached_property
+    def self_id(self):
+        return self.event.self_id
+
+    @cached_property
+    def post_type(self) -> str:
+        return self.event.post_type
+
+    @cached_property
+    def sender_role(self) -> str | None:
+        sender = getattr(self.event, 'sender', None)
+        return getattr(sender, 'role', None)
+
+    @cached_property
+    def message_id(self):
+        return getattr(self.event, 'message_id', None)
+
+    @cached_property
+    def event_dict(self) -> dict:
+        """完整序列化的事件 仅在确实需要时使用"""
+        return self.event.dict(exclude={'match'})
+
+
+# 以事件的id为键 不写入事件模型的字段 event.json()/dict() 不受影响
+_contexts: {int: EventContext} = {}
+
+
+def get_context(event: Event) -> EventContext:
+    """
+    获取事件的分发上下文 首次调用时创建 事件被回收时移除
+    """
+    context = _contexts.get(id(event))
+    if context is None or context.event is not event:
+        context = EventContext(event)
+        _contexts[id(event)] = context
+        weakref.finalize(event, _contexts.pop, id(event), None)
+    return context
@@ -15,6 +15,12 @@ SV_POSITIVELY_FINISHED = 'Positive Function <green>{func_name}</> of Message {mi
 
 SV_ERROR_HAPPENED = 'Function {module}.{sv}.{func} Caused a {exception} Exception When Processing Message {message}'
 
+SV_TIMEOUT_HAPPENED = 'Function {module}.{sv}.{func} Timed Out After {timeout}s When Processing Message {message}'
+
+SV_REJECTED_HAPPENED = 'Function {module}.{sv}.{func} Saturated and Rejected Message {message}'
+
+SV_DROPPED_HAPPENED = 'Passive Function {module}.{sv}.{func} Dropped Message {message}: {pending} Passive Functions Pending'
+
 SV_ADDED_INFO = 'Succeeded to import "<c>{module_name}.{service_name}</>"'
 
 SV_SCHEDULED_JOB_RUN = 'Scheduled Job <green>{job}</> From {module}.{service} Start'
@@ -1,18 +1,21 @@
+import asyncio
 import time
-from typing import Tuple
 
 from nonebot import on_message, Bot, on_notice, on_request
 from nonebot.adapters import Event
 from nonebot.exception import FinishedException
 from nonebot.log import logger
 
-from .config import NICKNAME
+from .config import NICKNAME, PASSIVE_DISPATCH, PASSIVE_CONCURRENCY, PASSIVE_DRAIN_TIMEOUT, PASSIVE_MAX_PENDING
+from .context import get_context
 from .format import *
-from .handler.function import Function
-from .handler.module import loaded_modules, Module
+from .handler.function import Function, ExecutionPolicy
+from .handler.module import loaded_modules, Module, dispatch_table
 from .handler.service import Service
 from .handler.trigger import message_trigger
-from .utils import get_area_id
+from .metrics import messages_total, match_seconds, permission_seconds, observe_function
+from .recorder import recorder
+from .tracing import trace, span
 
 message_processor = on_message()
 
@@ -27,34 +30,39 @@ event_property = [
 
 @message_processor.handle()
 async def handle_message(bot: Bot, event: Event):
+    recorder.record(event)
+    context = get_context(event)
+    with trace('message', mid=context.message_id, area=context.area_id):
+        await dispatch_message(bot, event)
+
+
+async def dispatch_message(bot: Bot, event: Event):
     event.match = {}
     positive_triggered = False
-    area_id = get_area_id(event)
-    functions = message_trigger.match(event)
+    context = get_context(event)
+    area_id = context.area_id
+    messages_total.inc()
+    with span('eligible'):
+        eligible = dispatch_table.eligible(area_id)
+    with match_seconds.time(), span('match'):
+        functions = message_trigger.match(event, eligible)
 
     for function in functions:
         if positive_triggered and function.positive:
             continue
 
         module: Module = loaded_modules[function.module_name]
-        if not check_field(area_id, module):
-            continue
-
         service: Service = module.services[function.service_name]
-        if not check_field(area_id, service):
-            continue
-        if not service.check_permission(event):
+        with permission_seconds.time(), span('permission', function=function.name):
+            permitted = service.check_permission(event)
+        if not permitted:
             continue  # permission denied.
-        if not service.check_availability(event):
-            continue
 
-        if not check_field(area_id, function):
-            continue
         if function.dm_only:
             if not event.is_tome():
                 flag = 0
                 for nickname in NICKNAME:
-                    if nickname in (str(event.get_message())):
+                    if nickname in context.message:
                         flag = 1
                         break
                 if not flag:
@@ -64,7 +72,7 @@ async def handle_message(bot: Bot, event: Event):
             service.logger.opt(colors=True).info(
                 SV_POSITIVELY_TRIGGERED.format(
                     func_name=function.name.capitalize(),
-                    mid=event.dict()["message_id"],
+                    mid=context.message_id,
                 )
             )
             t1=time.time()
@@ -74,40 +82,119 @@ async def handle_message(bot: Bot, event: Event):
             service.logger.opt(colors=True).info(
                 SV_POSITIVELY_FINISHED.format(
                     func_name=function.name.capitalize(),
-                    mid=event.dict()["message_id"],
+                    mid=context.message_id,
                     time=f"{t2-t1:.2f}"
                 )
             )
+        elif PASSIVE_DISPATCH == 'concurrent':
+            spawn_passive(function, bot, event)
         else:
             await trigger_function(function, bot, event)
 
 
-def check_field(area_id: str, item: Function | Service | Module):
-    field: Tuple[int, int, int] | Tuple[bool, bool, bool] = item.field
-    if area_id.startswith('u') and not field[0]:
-        return False
-    elif area_id.startswith('g') and not field[1]:
-        return False
-    elif area_id.startswith('c') and not field[2]:
-        return False
-    return True
-
-
 async def trigger_function(function: Function, bot: Bot, event: Event):
+    status = 'ok'
+    start = time.perf_counter()
     try:
-        await function.func(bot, event)
+        with span('function', func=f'{function.module_name}.{function.service_name}.{function.name}'):
+            if function.policy is None:
+                await function.func(bot, event)
+            else:
+                status = await trigger_with_policy(function, bot, event)
     except FinishedException:
         raise
     except Exception as e:
+        status = 'error'
         logger.error(
             SV_ERROR_HAPPENED.format(
                 module=function.module_name,
                 sv=function.service_name,
                 func=function.name,
-                message=event.dict()["message_id"],
+                message=get_context(event).message_id,
                 exception=type(e)
             ))
         logger.exception(e)
+    finally:
+        observe_function(function, time.perf_counter() - start, status)
+
+
+async def trigger_with_policy(function: Function, bot: Bot, event: Event) -> str:
+    """按执行策略执行功能 返回执行结果 'ok' 'timeout' 或 'rejected'"""
+    policy = function.policy
+    context = get_context(event)
+    async with function.slot(context.area_id) as admitted:
+        if not admitted:
+            logger.warning(
+                SV_REJECTED_HAPPENED.format(
+                    module=function.module_name,
+                    sv=function.service_name,
+                    func=function.name,
+                    message=context.message_id,
+                ))
+            if policy.saturated == ExecutionPolicy.NOTIFY:
+                service: Service = loaded_modules[function.module_name].services[function.service_name]
+                await service.reply(event, policy.notice)
+            return 'rejected'
+        try:
+            await asyncio.wait_for(function.func(bot, event), policy.timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                SV_TIMEOUT_HAPPENED.format(
+                    module=function.module_name,
+                    sv=function.service_name,
+                    func=function.name,
+                    timeout=policy.timeout,
+                    message=context.message_id,
+                ))
+            return 'timeout'
+    return 'ok'
+
+
+passive_tasks: set[asyncio.Task] = set()
+_passive_semaphore: asyncio.Semaphore | None = None
+
+
+def spawn_passive(function: Function, bot: Bot, event: Event):
+    """
+    非主动功能作为独立任务执行 不阻塞主动功能的回复
+    同时执行的数量不超过 PASSIVE_CONCURRENCY 等待与执行中的任务超过 PASSIVE_MAX_PENDING 时丢弃
+    """
+    if len(passive_tasks) >= PASSIVE_MAX_PENDING:
+        observe_function(function, 0, 'dropped')
+        logger.warning(
+            SV_DROPPED_HAPPENED.format(
+                module=function.module_name,
+                sv=function.service_name,
+                func=function.name,
+                message=get_context(event).message_id,
+                pending=len(passive_tasks),
+            ))
+        return
+    task = asyncio.create_task(run_passive(function, bot, event))
+    passive_tasks.add(task)
+    task.add_done_callback(passive_tasks.discard)
+
+
+async def run_passive(function: Function, bot: Bot, event: Event):
+    global _passive_semaphore
+    if _passive_semaphore is None:
+        _passive_semaphore = asyncio.Semaphore(PASSIVE_CONCURRENCY)
+    async with _passive_semaphore:
+        try:
+            await trigger_function(function, bot, event)
+        except FinishedException:
+            pass  # 独立任务中finish只结束该功能
+
+
+async def drain_passive(timeout: float = PASSIVE_DRAIN_TIMEOUT):
+    """等待执行中的非主动功能结束 超时后取消"""
+    if not passive_tasks:
+        return
+    _, pending = await asyncio.wait(set(passive_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f'{len(pending)} Passive Functions Cancelled on Shutdown')
 
 
 notice_processor = on_notice()
@@ -115,7 +202,7 @@ notice_processor = on_notice()
 
 @notice_processor.handle()
 async def handle_notice(bot: Bot, event: Event):
-    pass
+    recorder.record(event)
 
 
 request_processor = on_request()
@@ -130,4 +217,4 @@ REQUEST_TYPE = {
 
 @request_processor.handle()
 async def handle_request(bot: Bot, event: Event):
-    pass
+    recorder.record(event)
@@ -1,5 +1,5 @@
-from .function import Function
-from .module import Module, loaded_modules, set_module_status
+from .function import Function, ExecutionPolicy
+from .module import Module, loaded_modules, set_module_status, dispatch_table
 from .resource import Resource
 from .service import Service
 from .trigger import message_trigger, notice_trigger
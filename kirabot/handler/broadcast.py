@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from nonebot.log import logger
+
+from .outbox import send_priority, BROADCAST
+from ..config import BROADCAST_CONCURRENCY
+
+_running: set[asyncio.Task] = set()
+
+
+class Broadcast:
+    """
+    广播任务
+    在后台向多个区域发送消息 同时发送 concurrency 个区域
+    消息以广播优先级进入发送队列 受全局发送限速约束 不会阻塞互动回复
+    单个区域失败不影响其他区域 失败的发送由发送队列重试 这里不再重试
+    """
+
+    def __init__(
+            self,
+            name: str,
+            area_ids: list[str],
+            send: Callable[[str], Awaitable],
+            concurrency: int = BROADCAST_CONCURRENCY,
+            interval: float = 0,
+    ):
+        """
+        Args:
+            name: 广播名 用于日志
+            area_ids: 目标区域
+            send: send(area_id) 向单个区域发送
+            concurrency: 并发窗口大小
+            interval: 每个并发窗口内两次发送的间隔(秒)
+        """
+        self.name = name
+        self.area_ids = list(dict.fromkeys(area_ids))
+        self.concurrency = max(1, concurrency)
+        self.interval = interval
+        self.sent: list[str] = []
+        self.failed: {str: str} = {}
+        self.started: float | None = None
+        self.finished: float | None = None
+        self._send = send
+        self._task: asyncio.Task | None = None
+
+    @property
+    def total(self) -> int:
+        return len(self.area_ids)
+
+    @property
+    def progress(self) -> float:
+        """已完成的比例"""
+        return (len(self.sent) + len(self.failed)) / self.total if self.total else 1.0
+
+    @property
+    def done(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._task is not None and self._task.cancelled()
+
+    def start(self) -> 'Broadcast':
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            _running.add(self._task)
+            self._task.add_done_callback(self._finish)
+        return self
+
+    def cancel(self):
+        """取消未发送的部分"""
+        if self._task is not None:
+            self._task.cancel()
+
+    async def wait(self) -> dict:
+        """等待广播结束 返回发送结果"""
+        if self._task is not None:
+            try:
+                await asyncio.shield(self._task)
+            except asyncio.CancelledError:
+                if not self._task.cancelled():
+                    raise
+        return self.summary()
+
+    def summary(self) -> dict:
+        end = self.finished or time.time()
+        return {
+            'name': self.name,
+            'total': self.total,
+            'sent': len(self.sent),
+            'failed': dict(self.failed),
+            'pending': self.total - len(self.sent) - len(self.failed),
+            'cancelled': self.cancelled,
+            'elapsed': round(end - self.started, 2) if self.started else 0,
+        }
+
+    async def _run(self):
+        self.started = time.time()
+        send_priority.set(BROADCAST)
+        queue = asyncio.Queue()
+        for area_id in self.area_ids:
+            queue.put_nowait(area_id)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(min(self.concurrency, self.total))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while not queue.empty():
+            area_id = queue.get_nowait()
+            try:
+                await self._send(area_id)
+                self.sent.append(area_id)
+            except Exception as e:
+                self.failed[area_id] = f'{type(e).__name__}: {e}'
+            if self.interval:
+                await asyncio.sleep(self.interval)
+
+    def _finish(self, task: asyncio.Task):
+        _running.discard(task)
+        self.finished = time.time()
+        summary = self.summary()
+        logger.info(
+            f"Broadcast {self.name} {'Cancelled' if summary['cancelled'] else 'Finished'}: "
+            f"{summary['sent']}/{summary['total']} Sent, {len(summary['failed'])} Failed in {summary['elapsed']}s"
+        )
+        if not task.cancelled() and task.exception():
+            logger.opt(exception=task.exception()).error(f'Exception in Broadcast {self.name}')
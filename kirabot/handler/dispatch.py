@@ -0,0 +1,72 @@
+from typing import Set, Tuple
+
+from .function import Function
+from .trigger import message_trigger
+
+
+def check_field(area_id: str, item) -> bool:
+    field: Tuple[int, int, int] | Tuple[bool, bool, bool] = item.field
+    if area_id.startswith('u') and not field[0]:
+        return False
+    elif area_id.startswith('g') and not field[1]:
+        return False
+    elif area_id.startswith('c') and not field[2]:
+        return False
+    return True
+
+
+class DispatchTable:
+    """
+    区域调度表
+    记录每个区域内 模块/服务/功能的作用域均包含该区域 且服务在该区域启用的功能
+    在区域收到第一条消息时计算 模块或服务的启用状态改变时失效
+    """
+
+    def __init__(self, modules: dict):
+        """
+        modules: 已加载的模块 {模块名: Module}
+        """
+        self.modules = modules
+        self._tables: {str: frozenset} = {}
+        self._shared: {frozenset: frozenset} = {}  # 内容相同的表只保留一份
+        self._version = -1
+
+    def eligible(self, area_id: str) -> Set[Function]:
+        version = message_trigger.version()
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+        table = self._tables.get(area_id)
+        if table is None:
+            table = self.build(area_id)
+            table = self._shared.setdefault(table, table)
+            self._tables[area_id] = table
+        return table
+
+    def build(self, area_id: str) -> frozenset:
+        services: {tuple: bool} = {}
+        functions = set()
+        for function in message_trigger.functions():
+            pointer = (function.module_name, function.service_name)
+            if pointer not in services:
+                module = self.modules.get(function.module_name)
+                service = module.services.get(function.service_name) if module else None
+                services[pointer] = bool(
+                    service
+                    and check_field(area_id, module)
+                    and check_field(area_id, service)
+                    and service.available_in(area_id)
+                )
+            if services[pointer] and check_field(area_id, function):
+                functions.add(function)
+        return frozenset(functions)
+
+    def invalidate(self, area_id: str = None):
+        """
+        area_id: 失效的区域 为None时全部失效
+        """
+        if area_id is None:
+            self._tables.clear()
+            self._shared.clear()
+        else:
+            self._tables.pop(area_id, None)
@@ -1,6 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Callable, Tuple
 
 
+class ExecutionPolicy:
+    QUEUE = 'queue'
+    DROP = 'drop'
+    NOTIFY = 'notify'
+
+    def __init__(
+            self,
+            timeout: float = None,
+            concurrency: int = None,
+            area_concurrency: int = None,
+            saturated: str = QUEUE,
+            notice: str = '当前请求过多 请稍后再试',
+    ):
+        """
+        功能的执行策略
+        timeout: float,执行超时(秒) 超时后取消 为None时不限制
+        concurrency: int,该功能同时执行的上限
+        area_concurrency: int,该功能在同一区域内同时执行的上限
+        saturated: str,达到上限时 'queue':排队等待 'drop':忽略 'notify':忽略并回复notice
+        notice: str,saturated为'notify'时回复的内容
+        """
+        if saturated not in (self.QUEUE, self.DROP, self.NOTIFY):
+            raise ValueError(f'Unknown Saturation Behavior {saturated}')
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.area_concurrency = area_concurrency
+        self.saturated = saturated
+        self.notice = notice
+
+
 class Function:
     def __init__(
             self,
@@ -9,7 +41,8 @@ class Function:
             func: Callable,
             dm_only: bool = False,
             field: Tuple[int, int, int] | Tuple[bool, bool, bool] = (0, 1, 1),
-            positive: bool = True
+            positive: bool = True,
+            policy: ExecutionPolicy = None,
     ):
         """
         sv_name: str,服务名称
@@ -17,6 +50,7 @@ class Function:
         dm_only: bool,是否为DM功能
         field: Tuple[int, int, int] = None,作用域
         positive: bool = True,是否为主动功能
+        policy: ExecutionPolicy = None,执行策略
         """
         self.module_name = module_name
         self.service_name = service_name
@@ -24,7 +58,46 @@ class Function:
         self.dm_only = dm_only
         self.field = field
         self.positive = positive
+        self.policy = policy
         self.name = func.__name__
+        self._semaphore: asyncio.Semaphore | None = None
+        self._area_semaphores: {str: list} = {}  # {区域: [Semaphore, 使用数]}
 
     def __call__(self, *args, **kwargs):
         return self.func(*args, **kwargs)
+
+    @asynccontextmanager
+    async def slot(self, area_id: str):
+        """
+        按执行策略取得执行名额 返回是否取得
+        saturated为'queue'时等待名额 否则名额已满时立即返回False
+        """
+        policy = self.policy
+        semaphores = []
+        # 先取区域名额 再取全局名额 同一区域排队的请求不会占用其他区域可用的全局名额
+        if policy.area_concurrency:
+            entry = self._area_semaphores.get(area_id)
+            if entry is None:
+                entry = self._area_semaphores[area_id] = [asyncio.Semaphore(policy.area_concurrency), 0]
+            entry[1] += 1
+            semaphores.append(entry[0])
+        if policy.concurrency:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(policy.concurrency)
+            semaphores.append(self._semaphore)
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                if policy.saturated != ExecutionPolicy.QUEUE and semaphore.locked():
+                    break
+                await semaphore.acquire()
+                acquired.append(semaphore)
+            yield len(acquired) == len(semaphores)
+        finally:
+            for semaphore in acquired:
+                semaphore.release()
+            if policy.area_concurrency:
+                entry = self._area_semaphores[area_id]
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._area_semaphores[area_id]
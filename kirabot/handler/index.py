@@ -0,0 +1,221 @@
+import bisect
+import re
+from collections import Counter, defaultdict, deque
+from typing import Dict, Iterable, List, Set
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+_END = ''  # 结点终止标记 单个字符不会是空串
+
+
+class KeyTrie:
+    """
+    字符前缀树
+    walk(text) 返回所有为 text 前缀的键所登记的值
+    """
+
+    def __init__(self):
+        self.root: dict = {}
+
+    def add(self, key: str, value: int):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(_END, []).append(value)
+
+    def walk(self, text: Iterable[str]) -> List[int]:
+        node = self.root
+        found: List[int] = list(node.get(_END, ()))
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if _END in node:
+                found.extend(node[_END])
+        return found
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机
+    add() 只向转移表中插入新的键 失配指针在下一次 search() 前按需重建
+    """
+
+    def __init__(self):
+        self._goto: List[dict] = [{}]
+        self._output: List[List[int]] = [[]]
+        self._fail: List[int] = [0]
+        self._dict_link: List[int] = [0]
+        self._dirty = False
+
+    def add(self, key: str, value: int):
+        node = 0
+        for char in key:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._output.append([])
+            node = nxt
+        self._output[node].append(value)
+        self._dirty = True
+
+    def build(self):
+        size = len(self._goto)
+        self._fail = [0] * size
+        self._dict_link = [0] * size
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                state = self._fail[node]
+                while state and char not in self._goto[state]:
+                    state = self._fail[state]
+                fail = self._goto[state].get(char, 0)
+                self._fail[child] = fail if fail != child else 0
+                # 指向最近的一个有输出的失配祖先 避免在匹配时遍历整条失配链
+                self._dict_link[child] = fail if self._output[fail] else self._dict_link[fail]
+                queue.append(child)
+        self._dirty = False
+
+    def search(self, text: Iterable[str]) -> Set[int]:
+        if self._dirty:
+            self.build()
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        found: Set[int] = set(output[0])
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state
+            while node:
+                if output[node]:
+                    found.update(output[node])
+                node = dict_link[node]
+        return found
+
+
+class FuzzyIndex:
+    """
+    模糊匹配候选筛选
+    以 长度比 和 字符倒排索引统计的公共字符数 估计相似度上界
+    上界不可能超过阈值的触发词无需计算完整的相似度
+    """
+
+    def __init__(self):
+        self.lengths: List[int] = []  # 有序 用于判断长度窗口内是否存在触发词
+        self.key_length: Dict[int, int] = {}
+        self.rates: Dict[int, float | None] = {}
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+
+    def add(self, key: str, order: int, rate: float = None):
+        bisect.insort(self.lengths, len(key))
+        self.key_length[order] = len(key)
+        self.rates[order] = rate
+        for char, count in Counter(key).items():
+            self.postings[char].append((order, count))
+
+    def min_rate(self, default_rate: float) -> float:
+        return min((default_rate if rate is None else rate for rate in self.rates.values()), default=default_rate)
+
+    def candidates(self, text: str, default_rate: float) -> Dict[int, float]:
+        """
+        返回 {触发词顺序: 阈值} 仅包含上界可能超过阈值的触发词
+        相似度按 fuzzywuzzy 计 即 100 * 2M / (len(a) + len(b)) 四舍五入
+        M 不超过两串的公共字符数 也不超过较短串的长度
+        """
+        length = len(text)
+        if not length:
+            # 空串仅与空串相等 相似度为100
+            return {
+                order: default_rate if self.rates[order] is None else self.rates[order]
+                for order, key_length in self.key_length.items() if not key_length
+            }
+        # 四舍五入后 > rate 要求未取整值 > rate - 0.5
+        bound = (self.min_rate(default_rate) - 0.5) / 100
+        if bound > 0:
+            low = bound * length / (2 - bound)
+            high = length * (2 - bound) / bound if bound < 2 else 0
+            start = bisect.bisect_right(self.lengths, low)
+            if start >= len(self.lengths) or self.lengths[start] >= high:
+                return {}
+        shared: Dict[int, int] = defaultdict(int)
+        for char, count in Counter(text).items():
+            for order, key_count in self.postings.get(char, ()):
+                shared[order] += min(count, key_count)
+        result: Dict[int, float] = {}
+        for order, common in shared.items():
+            rate = self.rates[order]
+            rate = default_rate if rate is None else rate
+            if 200 * common / (self.key_length[order] + length) > rate - 0.5:
+                result[order] = rate
+        return result
+
+
+_REPEAT = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)}
+_GROUP = {sre_parse.SUBPATTERN, getattr(sre_parse, 'ATOMIC_GROUP', None)}
+
+
+def _requirements(items) -> List[tuple]:
+    """
+    收集一段已解析的表达式中 任何匹配都必然包含的字面量
+    每一项为若干候选字面量 匹配文本至少包含其中之一
+    """
+    requirements: List[tuple] = []
+    run: List[str] = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            requirements.append((''.join(run),))
+            run = []
+        if op in _GROUP:
+            if op is sre_parse.SUBPATTERN:
+                _, add_flags, _, av = av
+                if add_flags & re.IGNORECASE:
+                    continue
+            requirements.extend(_requirements(av))
+        elif op in _REPEAT:
+            min_repeat, _, body = av
+            if min_repeat >= 1:
+                requirements.extend(_requirements(body))
+        elif op is sre_parse.BRANCH:
+            alternatives = []
+            for branch in av[1]:
+                best = _best(_requirements(branch))
+                if not best:
+                    break
+                alternatives.extend(best)
+            else:
+                requirements.append(tuple(alternatives))
+    if run:
+        requirements.append((''.join(run),))
+    return requirements
+
+
+def _best(requirements: List[tuple]) -> tuple | None:
+    # 以最短候选的长度衡量筛选效果
+    return max(requirements, key=lambda alternatives: min(map(len, alternatives)), default=None)
+
+
+def required_literals(pattern: re.Pattern) -> tuple | None:
+    """
+    提取正则表达式匹配时必须出现的字面量 用于预筛选
+    返回若干候选字面量 匹配的文本至少包含其中之一
+    无法提取(忽略大小写 纯字符类等)时返回None
+    """
+    if not isinstance(pattern.pattern, str) or pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    return _best(_requirements(parsed))
@@ -3,6 +3,7 @@ from typing import Tuple
 
 import nonebot
 
+from .dispatch import DispatchTable
 from .resource import Resource
 from .service import Service
 from .. import auth
@@ -70,20 +71,12 @@ class Module:
 
 
 loaded_modules: {str: Module} = {}
+dispatch_table = DispatchTable(loaded_modules)
 
 
 def _change_area_service_availability(target_status: bool, area_id: str, service_to_change: Service):
-    if target_status:
-        if area_id in service_to_change.disabled_area:
-            service_to_change.disabled_area.remove(area_id)
-        if area_id not in service_to_change.enabled_area:
-            service_to_change.enabled_area.append(area_id)
-    else:
-        if area_id not in service_to_change.disabled_area:
-            service_to_change.disabled_area.append(area_id)
-        if area_id in service_to_change.enabled_area:
-            service_to_change.enabled_area.remove(area_id)
-    service_to_change.save_config(service_to_change.update_config())
+    service_to_change.set_area_status(area_id, target_status)
+    dispatch_table.invalidate(area_id)
 
 
 def set_module_status(area_id: str, target_status: bool, module_name: str, service_name: str = None) -> bool:
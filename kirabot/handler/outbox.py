@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextvars import Context, ContextVar, copy_context
+from typing import Awaitable, Callable
+
+from nonebot.exception import ActionFailed
+from nonebot.log import logger
+
+from ..config import SEND_AREA_INTERVAL, SEND_RETRY, SEND_RETRY_BACKOFF
+from ..metrics import registry, send_seconds, send_total
+from ..utils import TokenBucket, send_bucket
+
+# 发送优先级 数值越小越先发送
+INTERACTIVE = 0
+SCHEDULED = 1
+BROADCAST = 2
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', SCHEDULED: 'scheduled', BROADCAST: 'broadcast'}
+
+# 当前上下文中发送消息的优先级 定时任务与广播中会被修改
+send_priority: ContextVar[int] = ContextVar('send_priority', default=INTERACTIVE)
+
+
+class OutboundMessage:
+    __slots__ = ('priority', 'send', 'future', 'queued', 'context')
+
+    def __init__(self, priority: int, send: Callable[[], Awaitable], future: asyncio.Future):
+        self.priority = priority
+        self.send = send
+        self.future = future
+        self.queued = time.monotonic()
+        self.context = copy_context()  # 发送在提交者的上下文中执行 追踪与优先级归属于该消息
+
+
+class SendScheduler:
+    """
+    消息发送队列
+    每个区域一个先进先出队列 同一区域的消息按提交顺序依次发送 两次发送至少间隔 area_interval 秒
+    不同区域之间按队首消息的优先级(互动回复 > 定时推送 > 广播)调度 并共用全局令牌桶限速
+    发送时出现 ActionFailed 会退避重试
+    """
+
+    def __init__(self, bucket: TokenBucket, area_interval: float = SEND_AREA_INTERVAL,
+                 retry: int = SEND_RETRY, backoff: float = SEND_RETRY_BACKOFF):
+        self.bucket = bucket
+        self.area_interval = area_interval
+        self.retry = retry
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._queues: {str: deque[OutboundMessage]} = {}
+        self._ready: list[tuple[int, int, str]] = []  # (队首优先级, 序号, 区域)
+        self._scheduled: set[str] = set()  # 在_ready中 等待间隔或正在发送的区域
+        self._last_sent: {str: float} = {}
+        self._depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._counter = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+
+    async def submit(self, area_id: str, send: Callable[[], Awaitable], priority: int = None):
+        """
+        将发送加入区域队列 等待发送完成并返回 send() 的结果
+        priority 为None时使用当前上下文的 send_priority
+        """
+        loop = asyncio.get_running_loop()
+        priority = send_priority.get() if priority is None else priority
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f'Unknown Send Priority {priority}')
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            # 调度任务长期存在 不继承首个提交者的上下文(追踪span 发送优先级)
+            self._task = Context().run(loop.create_task, self._run())
+        message = OutboundMessage(priority, send, loop.create_future())
+        self._queues.setdefault(area_id, deque()).append(message)
+        self._depth[priority] += 1
+        if area_id not in self._scheduled:
+            self._scheduled.add(area_id)
+            self._schedule(area_id)
+        return await message.future
+
+    def depth(self, area_id: str = None) -> int:
+        """等待发送的消息数"""
+        if area_id is not None:
+            return len(self._queues.get(area_id, ()))
+        return sum(self._depth.values())
+
+    def stats(self) -> dict:
+        oldest = min(
+            (queue[0].queued for queue in self._queues.values() if queue), default=None
+        )
+        return {
+            'queued': self.depth(),
+            'by_priority': {PRIORITY_NAMES[p]: n for p, n in self._depth.items()},
+            'areas': sum(1 for queue in self._queues.values() if queue),
+            'oldest_wait': round(time.monotonic() - oldest, 3) if oldest is not None else 0,
+            'sending': len(self._sending),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+        }
+
+    async def shutdown(self, timeout: float = 5):
+        """等待队列中的消息发送完毕 超时后放弃剩余消息"""
+        deadline = time.monotonic() + timeout
+        while (self.depth() or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+        for queue in self._queues.values():
+            while queue:
+                message = queue.popleft()
+                self._depth[message.priority] -= 1
+                if not message.future.done():
+                    message.future.cancel()
+        if self.depth():
+            logger.warning(f'{self.depth()} Outbound Messages Dropped on Shutdown')
+
+    def _schedule(self, area_id: str):
+        delay = self._last_sent.get(area_id, 0) + self.area_interval - time.monotonic()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._push, area_id)
+        else:
+            self._push(area_id)
+
+    def _push(self, area_id: str):
+        queue = self._queues.get(area_id)
+        if not queue:
+            self._scheduled.discard(area_id)
+            return
+        heapq.heappush(self._ready, (queue[0].priority, next(self._counter), area_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self.bucket.acquire()
+            if not self._ready:
+                continue
+            _, _, area_id = heapq.heappop(self._ready)
+            queue = self._queues[area_id]
+            message = queue.popleft()
+            self._depth[message.priority] -= 1
+            if message.future.done():
+                # 提交者已取消 跳过
+                self._after_send(area_id)
+                continue
+            task = message.context.run(asyncio.create_task, self._deliver(area_id, message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, area_id: str, message: OutboundMessage):
+        try:
+            for attempt in range(self.retry + 1):
+                try:
+                    result = await message.send()
+                except ActionFailed as e:
+                    if attempt == self.retry:
+                        raise
+                    self.retried += 1
+                    logger.warning(f'Send to {area_id.capitalize()} Failed: {e}, Retry {attempt + 1}/{self.retry}')
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    await self.bucket.acquire()
+                else:
+                    self.sent += 1
+                    send_total.inc(PRIORITY_NAMES[message.priority], 'ok')
+                    if not message.future.done():
+                        message.future.set_result(result)
+                    return
+        except Exception as e:
+            self.failed += 1
+            send_total.inc(PRIORITY_NAMES[message.priority], 'failed')
+            if not message.future.done():
+                message.future.set_exception(e)
+        finally:
+            self._last_sent[area_id] = time.monotonic()
+            send_seconds.observe(self._last_sent[area_id] - message.queued, PRIORITY_NAMES[message.priority])
+            self._after_send(area_id)
+
+    def _after_send(self, area_id: str):
+        if self._queues.get(area_id):
+            self._schedule(area_id)
+        else:
+            self._queues.pop(area_id, None)
+            self._scheduled.discard(area_id)
+
+
+outbox = SendScheduler(send_bucket)
+
+registry.gauge(
+    'kirabot_send_queue_depth', 'Outbound messages waiting to be sent', ('priority',),
+    lambda: {(name,): n for name, n in outbox.stats()['by_priority'].items()},
+)
@@ -3,10 +3,9 @@ import os
 import zipfile
 from typing import Literal
 
-from filetype import filetype
 from nonebot.adapters.onebot.v11.adapter import MessageSegment
 
-from kirabot.utils.web import async_get_content
+from kirabot.utils.web import async_stream_download
 
 ROOT_PATH = os.path.join(os.path.dirname(__file__), "../../resource")
 
@@ -64,11 +63,9 @@ class Resource:
                     raise TypeError("File Type Not Supported")
 
             async def download(self, url, proxy: bool = True, headers: dict = None):
-                content = await async_get_content(url, proxy=proxy, headers=headers)
-                if not os.path.splitext(self.path)[1]:
-                    extension = filetype.guess_mime(content).split('/')[1]
-                    self.path += f'.{extension}'
-                self.save(content)
+                self.path = await async_stream_download(
+                    url, self.path, proxy=proxy, headers=headers, detect_type=True, overwrite=False
+                )
 
             def save(self, content, save_type: Literal['wb', 'w', 'wa'] = "wb", overwrite=False):
                 if self.exist and not overwrite:
@@ -1,4 +1,3 @@
-import asyncio
 import re
 import time
 from functools import wraps
@@ -12,12 +11,17 @@ from nonebot.adapters.onebot.v11 import Message, MessageSegment
 from nonebot.exception import ActionFailed
 from nonebot_plugin_apscheduler import scheduler
 
-from .function import Function
+from .broadcast import Broadcast
+from .function import Function, ExecutionPolicy
+from .outbox import outbox, send_priority, SCHEDULED
 from .resource import Resource
 from .trigger import MESSAGE_TRIGGER_TYPE, message_trigger, notice_trigger
 from .. import auth
-from ..config import update_config, get_config
+from ..config import update_config, update_config_item, get_config, BROADCAST_CONCURRENCY
+from ..context import get_context
 from ..format import *
+from ..metrics import scheduled_seconds, scheduled_total
+from ..tracing import span
 from ..utils import get_area_id, chain_reply
 
 
@@ -35,18 +39,16 @@ class Service:
     ):
         self.module_name = module_name
         self.name = name
-        self_dict = self.load_config()
+        self.enable = enable
+        self.area_status: {str: bool} = self.load_config()  # {区域id: 是否启用}
 
         self.field = field or (0, 1, 1)
         self.permission = _permission or auth.NORMAL
         self.visible = visible
-        self.enable = enable
         self.guidance = guidance
         self.logger = nonebot.log.logger
         self.functions: {str: Function} = {}
         self.scheduler = scheduler
-        self.enabled_area = self_dict["enabled_area"] or []
-        self.disabled_area = self_dict["disabled_area"] or []
         self.resource = Resource(self.module_name)
         self.re_pointer = f"{self.module_name}.{self.name}"
 
@@ -63,7 +65,9 @@ class Service:
             trigger: str | list[str] | re.Pattern,
             field_type: Tuple[int, int, int] | Tuple[bool, bool, bool] = None,
             direct: bool = False,
-            positive: bool = True
+            positive: bool = True,
+            fuzzy_rate: float = None,
+            policy: ExecutionPolicy = None,
     ) -> Callable:
         """
         消息触发任务
@@ -78,14 +82,20 @@ class Service:
         field_type:触发区规定 Tuple[bool](私聊,群聊,频道) 为真时可触发
         direct:是否需要@才能触发
         positive:是否是主动行为 为假可同步触发其他非主动行为
+         PASSIVE_DISPATCH为'concurrent'时 非主动行为在独立任务中执行 可能晚于主动行为的回复 finish只结束该功能
+        fuzzy_rate:模糊匹配的相似度阈值 仅对'fuzzy'生效 默认使用config.fuzzy_rate
+        policy:执行策略 超时 并发上限及达到上限时的处理 见ExecutionPolicy
         """
         ttype = MESSAGE_TRIGGER_TYPE[trigger_type] if isinstance(trigger_type, str) else trigger_type
         field_type = field_type or self.field or (0, 1, 1)
         positive = positive
+        options = {}
+        if ttype == MESSAGE_TRIGGER_TYPE['fuzzy']:
+            options['rate'] = fuzzy_rate
 
         def deco(func) -> Callable:
-            sf = Function(self.module_name, self.name, func, direct, field_type, positive)
-            message_trigger.trigger_chain[ttype].add_matcher(trigger, sf)
+            sf = Function(self.module_name, self.name, func, direct, field_type, positive, policy)
+            message_trigger.trigger_chain[ttype].add_matcher(trigger, sf, **options)
             return func
 
         self.logger.debug(f"added Message Trigger {trigger_type} {trigger}")
@@ -120,6 +130,7 @@ class Service:
         def deco(func: Callable) -> Callable:
             @wraps(func)
             async def wrapper():
+                send_priority.set(SCHEDULED)
                 try:
                     self.logger.opt(colors=True).info(
                         SV_SCHEDULED_JOB_RUN.format(
@@ -131,6 +142,8 @@ class Service:
                     time_start = time.time()
                     ret = await func()
                     time_end = time.time()
+                    scheduled_seconds.observe(time_end - time_start, self.module_name, self.name, func.__name__)
+                    scheduled_total.inc(self.module_name, self.name, func.__name__, 'ok')
                     self.logger.opt(colors=True).info(
                         SV_SCHEDULED_JOB_FINISHED.format(
                             module=self.module_name.capitalize(),
@@ -141,6 +154,7 @@ class Service:
                     )
                     return ret
                 except Exception as e:
+                    scheduled_total.inc(self.module_name, self.name, func.__name__, 'error')
                     self.logger.opt(colors=True).error(
                         SV_SCHEDULED_JOB_ERROR.format(
                             module=self.module_name.capitalize(),
@@ -160,50 +174,89 @@ class Service:
         """
         检查事件的权限值是否满足执行该服务的任务
         """
-        user_permission = auth.EventAuth(event).get_user_permission()
+        user_permission = auth.get_permission(event)
         return user_permission >= self.permission
 
     def check_availability(self, event: Event):
-        area_id = get_area_id(event)
+        return self.available_in(get_area_id(event))
+
+    def available_in(self, area_id: str):
+        """
+        服务在区域内是否启用
+        """
+        status = self.area_status.get(area_id)
         if self.enable:
-            if area_id in self.disabled_area:
-                return False
+            return status is not False
         else:
-            if area_id not in self.enabled_area:
-                return False
-        return True
+            return status is True
+
+    @property
+    def enabled_area(self) -> list[str]:
+        return [area_id for area_id, status in self.area_status.items() if status]
+
+    @property
+    def disabled_area(self) -> list[str]:
+        return [area_id for area_id, status in self.area_status.items() if not status]
+
+    def set_area_status(self, area_id: str, status: bool):
+        """
+        修改服务在单个区域的启用状态 只写入该区域的一个条目
+        """
+        if self.area_status.get(area_id) is status:
+            return
+        self.area_status[area_id] = status
+        update_config_item(status, self.module_name, self.area_key, area_id)
+
+    @property
+    def area_key(self) -> str:
+        """模块配置中保存区域状态的subkey 服务名不能包含'.' 不会与服务名冲突"""
+        return f'{self.name}.area'
 
-    async def broadcast(self, msg: str | Message | list, at_all: bool = False, interval: float = 0.5):
+    async def broadcast(self, msg: str | Message | list, at_all: bool = False, interval: float = 0,
+                        concurrency: int = BROADCAST_CONCURRENCY) -> Broadcast:
         """
-        服务广播
+        服务广播 在后台向所有启用该服务的区域发送 立即返回广播任务
+        需要等待发送完成时: summary = await (await sv.broadcast(msg)).wait()
 
         Args:
             msg: str 要进行广播的信息
             at_all: bool 是否要@全体成员
-            interval: float 每条信息发送时的间隔
+            interval: float 每个并发窗口内两次发送的间隔
+            concurrency: int 同时发送的区域数
 
         Returns:
-            None
+            Broadcast 可查看进度(progress) 结果(summary) 或取消(cancel)
         """
-        config = self.load_config()
-        area_ids = config['enabled_area']
-
         if at_all and not isinstance(msg, list):
             msg = "[CQ:at,qq=all]" + msg
 
-        for area_id in area_ids:
-            await asyncio.sleep(interval)
-            await self.send(area_id, msg)
+        return Broadcast(
+            self.re_pointer,
+            self.enabled_area,
+            lambda area_id: self.send(area_id, msg),
+            concurrency,
+            interval,
+        ).start()
 
     async def reply(self, event: Event, message: str | Message | list, at_sender=False):
-        area_id = get_area_id(event)
-        at = f"[CQ:at,qq={event.get_user_id()}]" if at_sender else ""
+        context = get_context(event)
+        area_id = context.area_id
+        at = f"[CQ:at,qq={context.user_id}]" if at_sender else ""
         if not isinstance(message, list):
             message = at + message
         mid = await self.send(area_id, message)
         return mid
 
-    async def send(self, area_id: str, message: str | Message | list):
+    async def send(self, area_id: str, message: str | Message | list, priority: int = None):
+        """
+        通过发送队列发送消息 同一区域的消息按顺序发送
+        priority: 发送优先级 见kirabot.handler.outbox 默认互动回复 定时任务与广播中分别为定时推送与广播
+        """
+        with span('send', area=area_id):
+            return await outbox.submit(area_id, lambda: self._send_now(area_id, message), priority)
+
+    async def _send_now(self, area_id: str, message: str | Message | list):
+        """直接调用bot接口发送消息"""
         try:
             if area_id.startswith('g'):
                 if isinstance(message, list):
@@ -250,34 +303,27 @@ class Service:
         """
         update_config(data, self.module_name, self.name)
 
-    def load_config(self):
+    def load_config(self) -> {str: bool}:
         """
-        加载服务配置
+        加载服务配置 返回各区域的启用状态 {区域id: 是否启用}
         """
         data = get_config(self.module_name)
-        if data:
-            if self.name not in data:
-                try:
-                    en_area = self.enabled_area
-                except AttributeError:
-                    en_area = []
-                try:
-                    dis_area = self.disabled_area
-                except AttributeError:
-                    dis_area = []
-                data[self.name] = {
-                    "name": self.name,
-                    "enabled_area": en_area,
-                    "disabled_area": dis_area,
-                }
-                update_config(data, self.module_name)
-            return data[self.name]
-        else:
-            return {
-                "name": self.name,
-                "enabled_area": [],
-                "disabled_area": [],
-            }
+        status = dict(data.get(self.area_key) or {})
+        legacy = data.get(self.name) or {}
+        if legacy.get("enabled_area") or legacy.get("disabled_area"):
+            # 旧版本以列表保存 转换为按区域保存的条目 同时出现在两个列表中的区域按原先的判断方式处理
+            lists = [(legacy.get("enabled_area") or [], True), (legacy.get("disabled_area") or [], False)]
+            if not self.enable:
+                lists.reverse()
+            for areas, value in lists:
+                for area_id in areas:
+                    status[area_id] = value
+            for area_id, value in status.items():
+                update_config_item(value, self.module_name, self.area_key, area_id)
+            update_config({"name": self.name}, self.module_name, self.name)
+        elif data and self.name not in data:
+            update_config({"name": self.name}, self.module_name, self.name)
+        return status
 
     def update_config(self) -> dict:
         """
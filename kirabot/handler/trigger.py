@@ -1,12 +1,14 @@
 import re
-from typing import List
+from typing import List, Set
 
 from fuzzywuzzy import fuzz
 from nonebot.adapters import Event
 from nonebot.log import logger
 
 from .function import Function
+from .index import KeyTrie, AhoCorasick, FuzzyIndex, required_literals
 from .. import config
+from ..context import get_context
 from ..config import NICKNAME
 from ..format import *
 
@@ -55,11 +57,16 @@ class MessageTrigger:
     class MainTrigger:
         def __init__(self):
             self.key: {str: Function} = {}
+            self.keys: List[str] = []
+            self.functions: List[Function] = []
 
-        def match(self, event: Event):
+        def match(self, event: Event, eligible: Set[Function] = None):
+            """
+            eligible: 当前区域允许触发的功能 为None时不做限制
+            """
             raise NotImplementedError
 
-        def add_matcher(self, keys: str | list[str], function: Function):
+        def add_matcher(self, keys: str | list[str], function: Function, **options):
             if not isinstance(keys, list):
                 keyword = [keys]
             else:
@@ -67,65 +74,96 @@ class MessageTrigger:
             for p in keyword:
                 if p not in self.key:
                     self.key[p] = function
+                    self.keys.append(p)
+                    self.functions.append(function)
+                    self.index(p, len(self.functions) - 1, **options)
                 else:
                     logger.error(
                         KEY_TRIGGER_ADD_ERROR.format(trigger=p))
 
+        def index(self, key: str, order: int, **options):
+            """
+            登记新触发词时增量更新索引 order为该触发词的注册顺序
+            options为 Service.at_message 传入的触发器参数
+            """
+            pass
+
+        def collect(self, orders, eligible: Set[Function] = None) -> List[Function]:
+            """
+            按注册顺序返回命中的功能 与逐个遍历触发词时的结果顺序一致
+            """
+            matched_func: List[Function] = []
+            for order in sorted(orders):
+                func = self.functions[order]
+                if eligible is not None and func not in eligible:
+                    continue
+                if func not in matched_func:
+                    matched_func.append(func)
+            return matched_func
+
     class Prefix(MainTrigger):
         def __init__(self) -> None:
             super().__init__()
+            self.trie = KeyTrie()
 
-        def match(self, event: Event):
-            message: str = str(event.get_message())
-            matched_func: List[Function] = []
-            for key in self.key:
-                me = message
-                func: Function = self.key[key]
-                if me.startswith(key):
-                    if func not in matched_func:
-                        matched_func.append(func)
-            return matched_func
+        def index(self, key: str, order: int, **options):
+            self.trie.add(key, order)
+
+        def match(self, event: Event, eligible: Set[Function] = None):
+            message: str = get_context(event).message
+            return self.collect(self.trie.walk(message), eligible)
 
     class Subfix(MainTrigger):
         def __init__(self) -> None:
             super().__init__()
+            self.trie = KeyTrie()
 
-        def match(self, event: Event):
-            message: str = str(event.get_message())
-            matched_func: List[Function] = []
-            for key in self.key:
-                me = message
-                func: Function = self.key[key]
-                if me.endswith(key) and (func not in matched_func):
-                    matched_func.append(func)
-            return matched_func
+        def index(self, key: str, order: int, **options):
+            self.trie.add(key[::-1], order)
+
+        def match(self, event: Event, eligible: Set[Function] = None):
+            message: str = get_context(event).message
+            return self.collect(self.trie.walk(reversed(message)), eligible)
 
     class FullMatch(MainTrigger):
         def __init__(self):
             super().__init__()
 
-        def match(self, event: Event):
-            message: str = str(event.get_message())
-            matched_func: List[Function] = []
-            for key in self.key:
-                me = message
-                func: Function = self.key[key]
-                if me == key and (func not in matched_func):
-                    matched_func.append(func)
-            return matched_func
+        def match(self, event: Event, eligible: Set[Function] = None):
+            message: str = get_context(event).message
+            func: Function = self.key.get(message)
+            if func and (eligible is None or func in eligible):
+                return [func]
+            return []
 
     class Regex(MainTrigger):
         def __init__(self):
             super().__init__()
+            self.patterns: List[re.Pattern] = []
+            self.automaton = AhoCorasick()
+            self.unfiltered: List[int] = []  # 无法预筛选的表达式 每条消息都需要检查
+
+        def index(self, key: str | re.Pattern, order: int, **options):
+            pattern = key if isinstance(key, re.Pattern) else re.compile(key)
+            self.patterns.append(pattern)
+            literals = required_literals(pattern)
+            if literals:
+                for literal in literals:
+                    self.automaton.add(literal, order)
+            else:
+                self.unfiltered.append(order)
 
-        def match(self, event: Event):
-            message: str = str(event.get_message())
+        def match(self, event: Event, eligible: Set[Function] = None):
+            message: str = get_context(event).message
+            candidates = self.automaton.search(message)
+            candidates.update(self.unfiltered)
             matched_func: List[Function] = []
-            for key in self.key:
-                me = message
-                func: Function = self.key[key]
-                match = re.search(key, me)
-                if match and (func not in matched_func):
+            for order in sorted(candidates):
+                func: Function = self.functions[order]
+                if func in matched_func or (eligible is not None and func not in eligible):
+                    continue
+                match = self.patterns[order].search(message)
+                if match:
                     event.match[f'{func.module_name}.{func.service_name}.{func.name}'] = match
                     matched_func.append(func)
             return matched_func
@@ -133,30 +171,33 @@ class MessageTrigger:
     class Keyword(MainTrigger):
         def __init__(self):
             super().__init__()
+            self.automaton = AhoCorasick()
 
-        def match(self, event: Event):
-            message: str = str(event.get_message())
-            matched_func: List[Function] = []
-            for key in self.key:
-                me = message
-                func: Function = self.key[key]
-                if key in me and (func not in matched_func):
-                    matched_func.append(func)
-            return matched_func
+        def index(self, key: str, order: int, **options):
+            self.automaton.add(key, order)
+
+        def match(self, event: Event, eligible: Set[Function] = None):
+            message: str = get_context(event).message
+            return self.collect(self.automaton.search(message), eligible)
 
     class Fuzzy(MainTrigger):
         def __init__(self):
             super().__init__()
+            self.fuzzy_index = FuzzyIndex()
 
-        def match(self, event: Event):
-            message: str = str(event.get_message())
-            matched_func: List[Function] = []
-            for key in self.key:
-                me = message
-                func: Function = self.key[key]
-                if fuzz.ratio(key, me) > config.fuzzy_rate:
-                    matched_func.append(func)
-            return matched_func
+        def index(self, key: str, order: int, rate: float = None, **options):
+            self.fuzzy_index.add(key, order, rate)
+
+        def match(self, event: Event, eligible: Set[Function] = None):
+            message: str = get_context(event).message
+            matched: List[int] = []
+            for order, rate in self.fuzzy_index.candidates(message, config.fuzzy_rate).items():
+                if eligible is not None and self.functions[order] not in eligible:
+                    continue
+                key = self.keys[order]
+                if fuzz.ratio(key, message) > rate:
+                    matched.append(order)
+            return self.collect(matched, eligible)
 
     def __init__(self):
         self.full = self.FullMatch()
@@ -174,14 +215,22 @@ class MessageTrigger:
             self.fuzzy
         ]
 
-    def match(self, event: Event):
+    def match(self, event: Event, eligible: Set[Function] = None):
         function: List[Function] = []
 
         for trigger in self.trigger_chain:
-            if s := trigger.match(event):
+            if s := trigger.match(event, eligible):
                 function += s
         return function
 
+    def functions(self) -> List[Function]:
+        """所有已注册的消息触发功能"""
+        return [function for trigger in self.trigger_chain for function in trigger.functions]
+
+    def version(self) -> int:
+        """已注册的触发词总数 每次注册新触发词后改变"""
+        return sum(len(trigger.functions) for trigger in self.trigger_chain)
+
 
 class NoticeTrigger:
     def __init__(self):
@@ -0,0 +1,163 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable
+
+from starlette.responses import PlainTextResponse
+
+from .config import METRICS_WINDOW
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """计数器"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: {tuple: float} = {}
+
+    def inc(self, *labels, value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def get(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, labels)} {value}' for labels, value in self.values.items()]
+
+
+class Gauge:
+    """由回调函数在导出时取值 回调返回 {标签值元组: 值}"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, collect: Callable[[], dict]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, labels)} {value}' for labels, value in self.collect().items()]
+
+
+class Summary:
+    """
+    延迟统计
+    记录总数与总和 分位数由最近 window 个样本计算
+    """
+    kind = 'summary'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), window: int = METRICS_WINDOW):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.window = window
+        self.values: {tuple: list} = {}  # {标签值: [数量, 总和, 样本]}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [0, 0.0, deque(maxlen=self.window)]
+        entry[0] += 1
+        entry[1] += value
+        entry[2].append(value)
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def quantiles(self, *labels) -> dict:
+        entry = self.values.get(labels)
+        if not entry or not entry[2]:
+            return {}
+        samples = sorted(entry[2])
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, (count, total, _) in self.values.items():
+            for q, value in self.quantiles(*labels).items():
+                quantile = f'quantile="{q}"'
+                lines.append(f'{self.name}{_labels(self.labelnames, labels, quantile)} {value:.6f}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: {str: Counter | Gauge | Summary} = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def summary(self, name: str, documentation: str, labelnames: tuple = ()) -> Summary:
+        return self.register(Summary(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple, collect: Callable[[], dict]) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+messages_total = registry.counter('kirabot_messages_total', 'Messages received')
+match_seconds = registry.summary('kirabot_match_seconds', 'Time spent matching triggers')
+permission_seconds = registry.summary('kirabot_permission_seconds', 'Time spent checking permissions')
+function_seconds = registry.summary(
+    'kirabot_function_seconds', 'Function latency', ('module', 'service', 'function'))
+service_seconds = registry.summary('kirabot_service_seconds', 'Function latency by service', ('module', 'service'))
+module_seconds = registry.summary('kirabot_module_seconds', 'Function latency by module', ('module',))
+function_total = registry.counter(
+    'kirabot_function_total', 'Function executions by result', ('module', 'service', 'function', 'status'))
+scheduled_seconds = registry.summary(
+    'kirabot_scheduled_job_seconds', 'Scheduled job latency', ('module', 'service', 'job'))
+scheduled_total = registry.counter(
+    'kirabot_scheduled_job_total', 'Scheduled job runs by result', ('module', 'service', 'job', 'status'))
+send_seconds = registry.summary(
+    'kirabot_send_seconds', 'Outbound message latency including queueing', ('priority',))
+send_total = registry.counter('kirabot_send_total', 'Outbound messages by result', ('priority', 'status'))
+
+
+def observe_function(function, elapsed: float, status: str):
+    """记录一次功能执行"""
+    module, service, name = function.module_name, function.service_name, function.name
+    function_seconds.observe(elapsed, module, service, name)
+    service_seconds.observe(elapsed, module, service)
+    module_seconds.observe(elapsed, module)
+    function_total.inc(module, service, name, status)
+
+
+async def endpoint(request):
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+
+from nonebot.adapters import Event
+from nonebot.log import logger
+
+from .config import RECORD_EVENTS, RECORD_PATH, RECORD_MAX_BYTES
+
+
+class EventRecorder:
+    """
+    入站事件记录
+    每行一个事件 {"t":接收时间,"e":OneBot事件数据} 可由 bench/replay.py 重放
+    写入先缓冲 最迟 flush_interval 秒后写入文件
+    超过 max_bytes 后将当前文件改名保存 并开始新文件
+    """
+
+    def __init__(self, path: str, enabled: bool = False, max_bytes: int = RECORD_MAX_BYTES,
+                 flush_interval: float = 1):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self._fp = None
+        self._size = 0
+        self._timer: asyncio.TimerHandle | None = None
+
+    def record(self, event: Event):
+        if not self.enabled:
+            return
+        try:
+            payload = event.json(exclude={'match'}, ensure_ascii=False, separators=(',', ':'))
+            line = f'{{"t":{time.time():.3f},"e":{payload}}}\n'
+            if self._fp is None:
+                self._open()
+            self._fp.write(line)
+            self._size += len(line.encode())
+            self.recorded += 1
+            if self._size > self.max_bytes:
+                self._rotate()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+        except Exception as e:
+            logger.error(f'Failed to Record Event: {e}')
+
+    def flush(self):
+        self._timer = None
+        if self._fp is not None:
+            try:
+                self._fp.flush()
+            except Exception as e:
+                logger.error(f'Failed to Flush Recorded Events: {e}')
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._fp = open(self.path, 'a', encoding='utf-8', buffering=1024 * 1024)
+        self._size = self._fp.tell()
+
+    def _rotate(self):
+        self.close()
+        base, ext = os.path.splitext(self.path)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        target, index = f'{base}-{stamp}{ext}', 1
+        while os.path.exists(target):
+            # 同一秒内多次切换时 不覆盖已保存的文件
+            target, index = f'{base}-{stamp}-{index}{ext}', index + 1
+        os.replace(self.path, target)
+
+
+recorder = EventRecorder(RECORD_PATH, RECORD_EVENTS)
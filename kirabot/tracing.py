@@ -0,0 +1,134 @@
+import random
+import time
+from contextvars import ContextVar
+from typing import Callable
+
+from nonebot.log import logger
+
+from .config import TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD, TRACE_LOG
+
+_current: ContextVar['Span | None'] = ContextVar('kirabot_span', default=None)
+_listeners: list[Callable[['Span'], None]] = []
+
+
+class Span:
+    """
+    追踪中的一个阶段
+    在追踪内创建的阶段会成为当前阶段的子阶段
+    """
+    __slots__ = ('name', 'attrs', 'children', 'start', 'end', 'sampled', '_token', '_root')
+
+    def __init__(self, name: str, attrs: dict, root: bool = False, sampled: bool = False):
+        self.name = name
+        self.attrs = attrs
+        self.children: list[Span] = []
+        self.start = 0.0
+        self.end = 0.0
+        self.sampled = sampled
+        self._token = None
+        self._root = root
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            parent.children.append(self)
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        if self._root:
+            _finish(self)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def walk(self, depth: int = 0):
+        """按先序遍历 返回 (深度, 阶段)"""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def format(self) -> str:
+        lines = []
+        for depth, span in self.walk():
+            attrs = ' '.join(f'{k}={v}' for k, v in span.attrs.items())
+            lines.append(f"{'  ' * depth}{span.name} {span.duration * 1000:.2f}ms {attrs}".rstrip())
+        return '\n'.join(lines)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def trace(name: str, **attrs) -> Span | _NoopSpan:
+    """
+    开始一次追踪 每次都记录各阶段耗时 以便检查慢请求
+    按 TRACE_SAMPLE_RATE 采样的追踪完整写入 TRACE_LOG
+    慢请求检查与采样均关闭且没有监听器时返回空操作对象 其中的 span() 也不会记录
+    """
+    sampled = bool(TRACE_SAMPLE_RATE) and random.random() < TRACE_SAMPLE_RATE
+    if sampled or _listeners or TRACE_SLOW_THRESHOLD is not None:
+        return Span(name, attrs, root=True, sampled=sampled)
+    return NOOP
+
+
+def span(name: str, **attrs) -> Span | _NoopSpan:
+    """在当前追踪中记录一个阶段 不在追踪中时为空操作"""
+    if _current.get() is None:
+        return NOOP
+    return Span(name, attrs)
+
+
+def current() -> Span | None:
+    return _current.get()
+
+
+def add_listener(listener: Callable[[Span], None]):
+    """每次追踪结束时以根阶段调用 listener 添加后所有消息都会被追踪"""
+    _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[Span], None]):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _finish(root: Span):
+    for listener in _listeners:
+        try:
+            listener(root)
+        except Exception as e:
+            logger.exception(e)
+    if TRACE_SLOW_THRESHOLD is not None and root.duration >= TRACE_SLOW_THRESHOLD:
+        logger.bind(trace=True).trace(f'Slow {root.format()}')
+    elif root.sampled:
+        logger.bind(trace=True).trace(root.format())
+
+
+def setup():
+    """开启追踪时将慢请求与被采样的追踪写入 TRACE_LOG"""
+    if TRACE_SAMPLE_RATE or TRACE_SLOW_THRESHOLD is not None:
+        logger.add(TRACE_LOG, level='TRACE', format='{time:YYYY-MM-DD HH:mm:ss.SSS} {message}',
+                   filter=lambda record: record['extra'].get('trace', False), rotation='10MB', retention=5)
@@ -1,17 +1,27 @@
+import asyncio
 import base64
-import json
+import hashlib
 import os
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from io import BytesIO
+from pathlib import Path
 
 from PIL import Image
 from nonebot import logger
 from nonebot.adapters.onebot.v11 import Event, Bot
 from nonebot.exception import ActionFailed
 
-from ..config import RESOURCE, SELF_ID, RNAME, SUPERUSERS
+from ..config import RESOURCE, SELF_ID, RNAME, SUPERUSERS, create_store, IMAGE_ENCODE_WORKERS, \
+    IMAGE_SIZE_BUDGET, IMAGE_FILE_THRESHOLD, IMAGE_CACHE_BYTES, IMAGE_FILE_CACHE_BYTES, SEND_RATE, SEND_BURST
+from ..context import get_context
+from .render import RenderCache
+
+
+data_store = create_store('data', RESOURCE + '/data/', indent=2)
 
 
 def chain_reply(msgs: list, bot_name: str = RNAME, bot_uid: int | str = SELF_ID[0]) -> list:
@@ -45,6 +55,104 @@ def pic2cq(pic: Image.Image | str):
     return f'[CQ:image,file={pic2b64(pic)}]'
 
 
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_ENCODE_WORKERS, thread_name_prefix='image')
+_image_cache: OrderedDict[str, str] = OrderedDict()  # {图片哈希: base64引用}
+_image_cache_size = 0
+_image_cache_lock = threading.Lock()
+# 写入文件的大图 内容寻址不会过期 与渲染缓存相同的方式按大小清理
+_image_files = RenderCache(os.path.join(RESOURCE, 'cache', 'image'), IMAGE_FILE_CACHE_BYTES, float('inf'))
+
+
+def _image_hash(pic: Image.Image, size_budget: int) -> str:
+    digest = hashlib.sha256(pic.tobytes())
+    digest.update(f'{pic.mode}{pic.size}{size_budget}'.encode())
+    return digest.hexdigest()
+
+
+def _encode_image(pic: Image.Image, size_budget: int) -> tuple[bytes, str]:
+    """
+    按大小预算选择格式 优先无损PNG
+    超出预算时依次尝试WebP与JPEG的较低质量 都超出时使用最小的结果
+    """
+    candidates = [('PNG', 'png', {})]
+    has_alpha = pic.mode in ('RGBA', 'LA', 'PA') or 'transparency' in pic.info
+    for quality in (90, 80, 65):
+        candidates.append(('WEBP', 'webp', {'quality': quality}))
+        if not has_alpha:
+            candidates.append(('JPEG', 'jpg', {'quality': quality}))
+    smallest = None
+    for fmt, ext, options in candidates:
+        buf = BytesIO()
+        try:
+            image = pic.convert('RGB') if fmt == 'JPEG' and pic.mode != 'RGB' else pic
+            image.save(buf, format=fmt, **options)
+        except (OSError, KeyError, ValueError):
+            continue  # 未编译WebP支持等
+        data = buf.getvalue()
+        if len(data) <= size_budget:
+            return data, ext
+        if smallest is None or len(data) < len(smallest[0]):
+            smallest = (data, ext)
+    if smallest is None:
+        # 所有格式都不支持该图片模式(如CMYK) 转换为RGBA后以PNG编码 不再限制大小
+        buf = BytesIO()
+        try:
+            pic.convert('RGBA').save(buf, format='PNG')
+        except (OSError, KeyError, ValueError) as e:
+            raise ValueError(f'Unable to Encode Image of Mode {pic.mode}: {e}') from e
+        smallest = (buf.getvalue(), 'png')
+    return smallest
+
+
+def _image_reference(pic: Image.Image, size_budget: int, file_threshold: int) -> str:
+    global _image_cache_size
+    key = _image_hash(pic, size_budget)
+    with _image_cache_lock:
+        if key in _image_cache:
+            _image_cache.move_to_end(key)
+            return _image_cache[key]
+    # 每次经由文件缓存取得路径 刚返回的文件不会被清理
+    path = _image_files.lookup(key)
+    if path is not None:
+        return Path(os.path.realpath(path)).as_uri()
+    data, ext = _encode_image(pic, size_budget)
+    if len(data) > file_threshold:
+        # 大图写入文件发送路径 避免base64使消息体积增加1/3
+        path = _image_files.store(key, data, ext)
+        return Path(os.path.realpath(path)).as_uri()
+    reference = 'base64://' + base64.b64encode(data).decode()
+    with _image_cache_lock:
+        if key not in _image_cache:
+            _image_cache[key] = reference
+            _image_cache_size += len(reference)
+        while _image_cache_size > IMAGE_CACHE_BYTES and _image_cache:
+            _, evicted = _image_cache.popitem(last=False)
+            _image_cache_size -= len(evicted)
+    return reference
+
+
+async def async_pic2b64(pic: Image.Image, size_budget: int = IMAGE_SIZE_BUDGET,
+                        file_threshold: int = IMAGE_FILE_THRESHOLD) -> str:
+    """
+    在线程池中编码图片 不阻塞事件循环
+    超出 size_budget 时改用有损格式 编码结果超过 file_threshold 时返回 file:// 引用而非 base64://
+    相同图片的编码结果会被缓存
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_image_executor, _image_reference, pic, size_budget, file_threshold)
+
+
+async def async_pic2cq(pic: Image.Image | str, size_budget: int = IMAGE_SIZE_BUDGET,
+                       file_threshold: int = IMAGE_FILE_THRESHOLD) -> str:
+    """图片转换为CQ码 本地文件直接使用 file:// 引用"""
+    if isinstance(pic, str):
+        path = os.path.realpath(pic)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f'Image File {pic} Not Found')
+        return f'[CQ:image,file={Path(path).as_uri()}]'
+    return f'[CQ:image,file={await async_pic2b64(pic, size_budget, file_threshold)}]'
+
+
 class FreqLimiter:
     def __init__(self, name: str, default_cd_seconds: int | float):
         self.name = name
@@ -130,6 +238,43 @@ class DailyNumberLimiter:
         self.update_data(data)
 
 
+class TokenBucket:
+    """
+    令牌桶限速 每秒补充 rate 个令牌 最多积累 capacity 个
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """等待直到取得令牌 等待者按先来后到获得令牌"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+# 全局发送限速 所有主动发送的消息共用
+send_bucket = TokenBucket(SEND_RATE, SEND_BURST)
+
+
 def render_list(lines: list, prompt: str = "") -> str:
     """生成制表符格式文本
     prompt:文本前缀
@@ -142,49 +287,29 @@ def render_list(lines: list, prompt: str = "") -> str:
     return prompt + "\n┣" + "\n┣".join(lines[:-1]) + "\n┗" + lines[-1]
 
 
-def _get_json_file_path(file_name: str = None, res_path: list[str] = None):
-    file_root = RESOURCE + '/data/'
-    file_root = os.path.join(file_root, "/".join(res_path))
-    os.makedirs(file_root, exist_ok=True)
-    if not file_name.endswith('.json'):
-        file_name += '.json'
-    # file_root += file_name
-    file_path = os.path.join(file_root, file_name)
-    return file_path
+def _get_json_key(file_name: str = None, res_path: list[str] = None):
+    file_name = file_name.removesuffix('.json')
+    return "/".join([*(res_path or []), file_name])
 
 
 def load_json(file_name: str = None, res_path: list[str] = None):
-    file_path = _get_json_file_path(file_name, res_path)
-    if not os.path.exists(file_path):
-        return None
+    """
+    读取 RESOURCE/data 下的数据 数据常驻内存
+    返回的对象与缓存共享 修改后需调用save_json保存
+    """
+    data = data_store.get(_get_json_key(file_name, res_path))
+    if data:
+        return data
     else:
-        try:
-            data = json.load(open(file_path, 'r', encoding='utf-8'))
-            if data:
-                return data
-            else:
-                return None
-        except json.JSONDecodeError:
-            os.remove(file_path)
-            return None
+        return None
 
 
 def save_json(data: dict | list, file_name: str = None, res_path: list[str] = None):
-    file_path = _get_json_file_path(file_name, res_path)
-
-    with open(file_path, 'w', encoding='utf-8') as fp:
-        json.dump(data, fp, ensure_ascii=False, indent=2)
+    data_store.update(data, _get_json_key(file_name, res_path))
 
 
 def get_area_id(event: Event) -> str:
-    ev_dict = event.dict()
-    if ev_dict['message_type'] == 'group':
-        area_id = f"g{ev_dict['group_id']}"
-    elif ev_dict['message_type'] == 'guild':
-        area_id = f'c{ev_dict["guild_id"]}-{ev_dict["channel_id"]}'
-    else:
-        area_id = f'u{ev_dict["user_id"]}'
-    return area_id
+    return get_context(event).area_id
 
 
 async def silence(bot: Bot, ev: Event, ban_time, skip_su=True):
@@ -0,0 +1,252 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from nonebot import logger
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from .web import get_driver
+from ..config import BROWSER_POOL_SIZE, BROWSER_MAX_USES, BROWSER_LEASE_TIMEOUT, BROWSER_POOL_WARM
+
+# Selenium的调用都是阻塞的 统一放到专用线程池中执行
+executor = ThreadPoolExecutor(max_workers=BROWSER_POOL_SIZE * 2, thread_name_prefix='browser')
+
+
+class BrowserPoolTimeout(TimeoutError):
+    pass
+
+
+class PooledDriver:
+    """
+    从浏览器池租借的浏览器
+    通过 run() 在专用线程池中调用Selenium 不阻塞事件循环
+    """
+
+    def __init__(self, driver: webdriver.Chrome):
+        self.driver = driver
+        self.uses = 0
+        self.broken = False
+
+    async def run(self, func, *args, **kwargs):
+        """
+        在浏览器线程池中执行 func(*args, **kwargs)
+        例: await browser.run(browser.driver.find_element, By.ID, 'main')
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+        except WebDriverException:
+            self.broken = True
+            raise
+
+    async def get(self, url: str):
+        await self.run(self.driver.get, url)
+
+    async def execute_script(self, script: str, *args):
+        return await self.run(self.driver.execute_script, script, *args)
+
+    async def screenshot(self) -> bytes:
+        return await self.run(self.driver.get_screenshot_as_png)
+
+
+class BrowserPool:
+    """
+    无头Chrome浏览器池
+    保留最多 size 个已启动的浏览器 租借前检查是否可用
+    使用 max_uses 次或出错后关闭并在需要时重新启动
+    所有浏览器都在使用中时排队等待 超过 timeout 秒抛出 BrowserPoolTimeout
+    关闭后不再租借 仍在租借中的浏览器归还时关闭
+    """
+
+    def __init__(self, use_proxy: bool = False, size: int = BROWSER_POOL_SIZE,
+                 max_uses: int = BROWSER_MAX_USES, timeout: float = BROWSER_LEASE_TIMEOUT):
+        self.use_proxy = use_proxy
+        self.size = size
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self._idle: list[PooledDriver] = []
+        self._created = 0
+        self._closed = False
+        self._condition: asyncio.Condition | None = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def lease(self, timeout: float = None):
+        """
+        async with pool.lease() as browser:
+            await browser.get(url)
+            png = await browser.screenshot()
+        """
+        browser = await self._acquire(self.timeout if timeout is None else timeout)
+        try:
+            yield browser
+        except BaseException:
+            # 出错或被取消(如执行超时)时 线程中的Selenium调用可能仍在进行 不能交给下一次租借
+            browser.broken = True
+            raise
+        finally:
+            await self._release(browser)
+
+    async def warm(self):
+        """启动浏览器直到池满"""
+        count = self.size - self._created
+        self._created += count
+        results = await asyncio.gather(*(self._create() for _ in range(count)), return_exceptions=True)
+        async with self.condition:
+            for result in results:
+                if isinstance(result, PooledDriver):
+                    self._idle.append(result)
+                else:
+                    self._created -= 1
+                    logger.error(f'Failed to Start Browser: {result}')
+            self.condition.notify_all()
+
+    async def close(self):
+        self._closed = True
+        async with self.condition:
+            idle, self._idle = self._idle, []
+            self.condition.notify_all()
+        for browser in idle:
+            await self._dispose(browser)
+
+    async def _acquire(self, timeout: float) -> PooledDriver:
+        deadline = time.monotonic() + timeout
+        while True:
+            async with self.condition:
+                if self._closed:
+                    raise RuntimeError('Browser Pool Closed')
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise BrowserPoolTimeout(f'No Browser Available in {timeout}s')
+                    try:
+                        await asyncio.wait_for(self.condition.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        raise BrowserPoolTimeout(f'No Browser Available in {timeout}s')
+                    if self._closed:
+                        raise RuntimeError('Browser Pool Closed')
+                browser = self._idle.pop() if self._idle else None
+                if browser is None:
+                    self._created += 1
+            if browser is None:
+                try:
+                    return await self._create()
+                except BaseException:
+                    # 包括被取消 不能在此等待锁 直接归还名额
+                    self._created -= 1
+                    self._notify()
+                    raise
+            try:
+                healthy = await self._healthy(browser)
+            except BaseException:
+                self._discard(browser)
+                raise
+            if healthy:
+                return browser
+            await self._dispose(browser)
+
+    async def _release(self, browser: PooledDriver):
+        browser.uses += 1
+        if self._closed or browser.broken or browser.uses >= self.max_uses:
+            await self._dispose(browser)
+        else:
+            async with self.condition:
+                self._idle.append(browser)
+                self.condition.notify()
+
+    async def _create(self) -> PooledDriver:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, get_driver, self.use_proxy)
+        try:
+            driver = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 线程中的启动无法中断 启动完成后关闭该浏览器
+            future.add_done_callback(_quit_started)
+            raise
+        return PooledDriver(driver)
+
+    async def _healthy(self, browser: PooledDriver) -> bool:
+        try:
+            return await asyncio.wait_for(browser.execute_script('return 1'), 5) == 1
+        except Exception:
+            return False
+
+    async def _dispose(self, browser: PooledDriver):
+        try:
+            await _quit(browser.driver)
+        finally:
+            self._created -= 1
+            self._notify()
+
+    def _discard(self, browser: PooledDriver):
+        """无法等待时(如被取消) 在后台关闭浏览器"""
+        task = asyncio.create_task(self._dispose(browser))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    def _notify(self):
+        """不持有锁时唤醒一个等待者"""
+        if self._condition is None:
+            return
+        task = asyncio.create_task(self._notify_locked())
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    async def _notify_locked(self):
+        async with self.condition:
+            self.condition.notify()
+
+
+_background: set[asyncio.Task] = set()
+
+
+async def _quit(driver: webdriver.Chrome):
+    loop = asyncio.get_running_loop()
+    try:
+        future = loop.run_in_executor(executor, driver.quit)
+    except RuntimeError:
+        # 浏览器线程池已关闭 (shutdown 之后归还的浏览器)
+        future = loop.run_in_executor(None, driver.quit)
+    try:
+        await asyncio.shield(future)
+    except Exception as e:
+        logger.warning(f'Failed to Quit Browser: {e}')
+
+
+def _quit_started(future: asyncio.Future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    task = asyncio.ensure_future(_quit(future.result()))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+pools = {False: BrowserPool(False), True: BrowserPool(True)}
+
+
+def lease(use_proxy: bool = False, timeout: float = None):
+    """
+    从浏览器池租借一个浏览器
+    async with browser.lease() as b:
+        await b.get(url)
+    """
+    return pools[use_proxy].lease(timeout)
+
+
+async def startup():
+    if BROWSER_POOL_WARM:
+        await pools[False].warm()
+
+
+async def shutdown():
+    for pool in pools.values():
+        await pool.close()
+    executor.shutdown(wait=False)
@@ -0,0 +1,190 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from PIL import Image
+from nonebot.adapters.onebot.v11 import MessageSegment
+
+from .web import single_flight
+from ..config import RESOURCE, RENDER_CACHE_BYTES, RENDER_CACHE_TTL, RENDER_CACHE_MIN_AGE
+
+
+def _encode(image: Image.Image) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return hashlib.sha256(value).hexdigest()
+    if isinstance(value, Image.Image):
+        digest = hashlib.sha256(value.tobytes()).hexdigest()
+        return [value.mode, value.size, digest]
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    # repr 通常包含内存地址 重启后无法命中 地址复用时还可能冲突
+    raise TypeError(f'Cannot Digest {type(value).__name__}, Pass a Key Explicitly')
+
+
+def digest(*parts) -> str:
+    """
+    渲染输入的内容哈希 parts 需能被json序列化
+    bytes/Image 按内容哈希 其他类型的对象抛出TypeError
+    """
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=_default)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class RenderCache:
+    """
+    渲染结果缓存
+    以渲染输入的内容哈希为key 将编码后的图片保存在 RESOURCE/cache/render
+    按LRU保留 总大小不超过 max_bytes 超过ttl秒的结果会重新渲染
+    文件路径返回后至少保留 min_age 秒 等待发送的消息不会引用到已删除的文件
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float, min_age: float = RENDER_CACHE_MIN_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        # {key: (文件名, 大小, 写入时间, 最后返回时间)}
+        self._index: OrderedDict[str, tuple[str, int, float, float]] | None = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    async def render(self, key: str, factory: Callable[[], Awaitable[bytes | Image.Image]],
+                     ttl: float = None, ext: str = 'png') -> MessageSegment:
+        """
+        返回 key 对应的图片消息段 不存在或已过期时调用 factory 渲染
+        factory 返回编码后的图片或 PIL.Image(在线程池中编码为PNG)
+        同一 key 的并发渲染只执行一次
+        """
+        path = await asyncio.to_thread(self.lookup, key, self.ttl if ttl is None else ttl)
+        if path is not None:
+            self.hits += 1
+            return MessageSegment.image(Path(path))
+        path = await single_flight.do(f'render:{key}', lambda: self._render(key, factory, ext))
+        return MessageSegment.image(Path(path))
+
+    def cached(self, ttl: float = None, key: Callable[..., str] = None):
+        """
+        缓存函数的渲染结果 被装饰的函数返回 bytes 或 PIL.Image 调用后得到图片消息段
+        默认以函数名与全部参数计算key 参数无法由 digest 计算时需传入 key(*args, **kwargs) 自行计算
+        同步函数会在线程池中执行
+
+        @render_cache.cached(ttl=60)
+        async def draw_rank(group_id, data) -> Image.Image: ...
+        """
+
+        def decorator(func):
+            name = f'{func.__module__}.{func.__qualname__}'
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs) -> MessageSegment:
+                cache_key = key(*args, **kwargs) if key else digest(name, args, kwargs)
+                if inspect.iscoroutinefunction(func):
+                    factory = functools.partial(func, *args, **kwargs)
+                else:
+                    factory = functools.partial(asyncio.to_thread, func, *args, **kwargs)
+                return await self.render(cache_key, factory, ttl)
+
+            return wrapper
+
+        return decorator
+
+    def lookup(self, key: str, ttl: float = None) -> str | None:
+        """未过期时返回缓存文件的路径"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            name, size, created, _ = entry
+            path = os.path.join(self.path, name)
+            if not os.path.exists(path):
+                self._remove(index, key, delete=False)
+                return None
+            now = time.time()
+            if created + ttl < now:
+                # 过期的文件可能仍被等待发送的消息引用 留给重新渲染时覆盖或按LRU清理
+                return None
+            index[key] = (name, size, created, now)
+            index.move_to_end(key)
+            return path
+
+    def store(self, key: str, data: bytes, ext: str = 'png') -> str:
+        """保存渲染结果 返回文件路径"""
+        name = f'{key}.{ext}'
+        path = os.path.join(self.path, name)
+        with self._lock:
+            index = self._load_index()
+            with open(path + '.tmp', 'wb') as fp:
+                fp.write(data)
+            os.replace(path + '.tmp', path)
+            if key in index:
+                self._remove(index, key, delete=index[key][0] != name)
+            now = time.time()
+            index[key] = (name, len(data), now, now)
+            self._size += len(data)
+            self._evict(index, now)
+        return path
+
+    def clear(self):
+        with self._lock:
+            index = self._load_index()
+            for key in list(index):
+                self._remove(index, key)
+
+    async def _render(self, key: str, factory, ext: str) -> str:
+        self.misses += 1
+        result = await factory()
+        if isinstance(result, Image.Image):
+            result = await asyncio.to_thread(_encode, result)
+            ext = 'png'
+        return await asyncio.to_thread(self.store, key, result, ext)
+
+    def _load_index(self) -> OrderedDict:
+        if self._index is None:
+            os.makedirs(self.path, exist_ok=True)
+            files = [entry for entry in os.scandir(self.path) if entry.is_file() and not entry.name.endswith('.tmp')]
+            files.sort(key=lambda entry: entry.stat().st_mtime)
+            self._index = OrderedDict(
+                (entry.name.split('.')[0], (entry.name, entry.stat().st_size, entry.stat().st_mtime, 0))
+                for entry in files
+            )
+            self._size = sum(entry[1] for entry in self._index.values())
+        return self._index
+
+    def _evict(self, index: OrderedDict, now: float):
+        # 按LRU顺序删除 跳过最近返回过路径的文件
+        for key in list(index):
+            if self._size <= self.max_bytes:
+                break
+            if index[key][3] + self.min_age <= now:
+                self._remove(index, key)
+
+    def _remove(self, index: OrderedDict, key: str, delete: bool = True):
+        name, size, _, _ = index.pop(key)
+        self._size -= size
+        if delete:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+render_cache = RenderCache(os.path.join(RESOURCE, 'cache', 'render'), RENDER_CACHE_BYTES, RENDER_CACHE_TTL)
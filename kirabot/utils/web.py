@@ -1,13 +1,40 @@
+import asyncio
+import functools
+import hashlib
 import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from urllib import parse
 
 import httpx
+from filetype import filetype
 from nonebot import logger
 from selenium import webdriver
 
-from ..config import HTTPX_PROXY
+from ..config import RESOURCE, HTTPX_PROXY, WEB_MAX_CONNECTIONS, WEB_MAX_KEEPALIVE, WEB_KEEPALIVE_EXPIRY, \
+    WEB_HOST_CONNECTIONS, WEB_HTTP2, WEB_RETRY_ATTEMPTS, WEB_RETRY_BACKOFF, WEB_RETRY_MAX_BACKOFF, \
+    WEB_CACHE_MEMORY_BYTES, WEB_CACHE_DISK, WEB_CACHE_DISK_BYTES, WEB_SINGLE_FLIGHT, \
+    WEB_DOWNLOAD_CONCURRENCY, WEB_DOWNLOAD_CHUNK_SIZE
+from ..tracing import span
+
+try:
+    import h2  # httpx的HTTP/2支持依赖h2
+except ImportError:
+    WEB_HTTP2 = False
 
 TIMEOUT = httpx.Timeout(10, read=15)
+LIMITS = httpx.Limits(
+    max_connections=WEB_MAX_CONNECTIONS,
+    max_keepalive_connections=WEB_MAX_KEEPALIVE,
+    keepalive_expiry=WEB_KEEPALIVE_EXPIRY,
+)
 
 CHROME_LOCATION = "C:/Program Files/Google/chrome/Application/chrome.exe"
 
@@ -36,46 +63,418 @@ def get_driver(use_proxy=False) -> webdriver.Chrome:
     return driver
 
 
-async def async_get(url: str, proxy: bool = False, headers: dict = None, params: dict = None, **kwargs):
-    try:
-        async with httpx.AsyncClient(proxies=HTTPX_PROXY if proxy else None, timeout=TIMEOUT) as client:
-            response = await client.get(url, headers=headers, params=params, **kwargs)
-        assert response.status_code < 210, response.status_code
-    except AssertionError as e:
-        logger.error(f'Exception Happened when async get {url}:Status Code {e.args[0]}')
-        with httpx.Client(proxies=HTTPX_PROXY if proxy else None, timeout=TIMEOUT) as client:
-            response = client.get(url, params=params, headers=headers, **kwargs)
-    return response
+class ClientPool:
+    """
+    共享的异步HTTP客户端
+    按是否使用代理各保留一个客户端 复用连接(keep-alive) 并限制对同一主机的并发请求数
+    在驱动器启动时创建 关闭时释放
+    """
 
+    def __init__(self):
+        self._clients: {bool: httpx.AsyncClient} = {}
+        self._hosts: {str: asyncio.Semaphore} = {}
 
-async def async_post(url: str, proxy: bool = False, headers: dict = None, data: dict = None, **kwargs):
-    try:
-        async with httpx.AsyncClient(proxies=HTTPX_PROXY if proxy else None, timeout=TIMEOUT) as client:
-            response = await client.post(url, headers=headers, data=data, **kwargs)
-        assert response.status_code < 210, response.status_code
-    except AssertionError as e:
-        logger.error(f'Exception Happened when async post {url}:Status Code {e.args[0]}')
-        with httpx.Client(proxies=HTTPX_PROXY if proxy else None, timeout=TIMEOUT) as client:
-            response = client.post(url, data=data, headers=headers, **kwargs)
-    return response
+    def client(self, proxy: bool = False) -> httpx.AsyncClient:
+        client = self._clients.get(proxy)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                proxies=HTTPX_PROXY if proxy else None,
+                timeout=TIMEOUT,
+                limits=LIMITS,
+                http2=WEB_HTTP2,
+            )
+            self._clients[proxy] = client
+        return client
+
+    def host_limit(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(WEB_HOST_CONNECTIONS)
+        return semaphore
+
+    async def request(self, method: str, url: str, proxy: bool = False, **kwargs) -> httpx.Response:
+        async with self.host_limit(url):
+            return await self.client(proxy).request(method, url, **kwargs)
+
+    async def startup(self):
+        self.client(False)
+        if HTTPX_PROXY:
+            self.client(True)
+
+    async def shutdown(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+client_pool = ClientPool()
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求
+    键相同的调用在前一次请求完成前共享同一个请求 其结果或异常会返回给所有等待者
+    请求在独立的任务中执行 单个等待者被取消不会影响其他等待者
+    """
+
+    def __init__(self):
+        self._flights: {str: asyncio.Future} = {}
+
+    @staticmethod
+    def key(method: str, url: str, proxy: bool, headers: dict = None, params: dict = None, **kwargs) -> str:
+        raw = json.dumps([method, url, proxy, headers or {}, params or {}, kwargs], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    async def do(self, key: str, factory: Callable[[], Awaitable]):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(factory())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(flight)
+
+    def _finish(self, key: str, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            flight.exception()  # 所有等待者都已取消时 避免 "exception was never retrieved"
+
+    def __len__(self):
+        return len(self._flights)
+
+
+single_flight = SingleFlight()
+
+
+class RetryPolicy:
+    """
+    请求重试策略
+    对超时/网络错误和 retry_status 中的状态码重试 等待时间按指数增长并加入随机抖动
+    响应带有 Retry-After 时按其指定的时间等待
+    """
 
+    def __init__(
+            self,
+            attempts: int = WEB_RETRY_ATTEMPTS,
+            backoff: float = WEB_RETRY_BACKOFF,
+            max_backoff: float = WEB_RETRY_MAX_BACKOFF,
+            jitter: float = 0.5,
+            retry_status: tuple = (408, 425, 429, 500, 502, 503, 504),
+            retry_exceptions: tuple = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError),
+    ):
+        """
+        Args:
+            attempts: 最多请求次数(含第一次)
+            backoff: 第一次重试前的等待时间(秒) 之后每次翻倍
+            max_backoff: 单次等待时间上限(秒) 同样限制 Retry-After
+            jitter: 随机缩短等待时间的比例 避免大量请求同时重试
+            retry_status: 需要重试的状态码
+            retry_exceptions: 需要重试的异常
+        """
+        self.attempts = max(attempts, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_status = retry_status
+        self.retry_exceptions = retry_exceptions
 
-async def async_head(url: str, proxy: bool = False, headers: dict = None, params: dict = None):
+    def delay(self, attempt: int, response: httpx.Response = None) -> float:
+        if response is not None and (retry_after := _parse_retry_after(response)) is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * (1 - random.random() * self.jitter)
+
+
+DEFAULT_RETRY = RetryPolicy()
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+class WebRequestError(httpx.HTTPError):
+    """
+    请求最终失败
+    status_code/response: 最后一次请求的响应(若有) cause: 最后一次请求的异常(若有)
+    继承 httpx.HTTPError 捕获 httpx.HTTPError 的已有代码仍然有效
+    """
+
+    def __init__(self, method: str, url: str, attempts: int,
+                 response: httpx.Response = None, cause: Exception = None):
+        self.method = method
+        self.url = url
+        self.attempts = attempts
+        self.response = response
+        self.status_code = response.status_code if response is not None else None
+        self.cause = cause
+        reason = f'Status Code {self.status_code}' if response is not None else f'{type(cause).__name__}: {cause}'
+        super().__init__(f'{method} {url} Failed After {attempts} Attempts: {reason}')
+        try:
+            self.request = response.request if response is not None else cause.request
+        except (AttributeError, RuntimeError):
+            pass  # 没有关联的请求
+
+
+def _parse_retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
     try:
-        async with httpx.AsyncClient(proxies=HTTPX_PROXY if proxy else None, timeout=TIMEOUT) as client:
-            response = await client.head(url, headers=headers, params=params)
-        assert response.status_code < 210, response.status_code
-    except AssertionError as e:
-        logger.error(f'Exception Happened when async head {url}:Status Code {e.args[0]}')
-        with httpx.Client(proxies=HTTPX_PROXY if proxy else None, timeout=TIMEOUT) as client:
-            response = client.head(url, params=params, headers=headers)
-    return response
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+async def async_request(method: str, url: str, proxy: bool = False, retry: RetryPolicy = None, **kwargs):
+    """
+    发送请求 按重试策略异步重试 不会阻塞事件循环
+    状态码>=400或重试耗尽时抛出 WebRequestError
+    """
+    retry = retry or DEFAULT_RETRY
+    for attempt in range(1, retry.attempts + 1):
+        response = None
+        try:
+            with span('web', method=method, url=url, attempt=attempt):
+                response = await client_pool.request(method, url, proxy, **kwargs)
+        except httpx.HTTPError as e:
+            if not isinstance(e, retry.retry_exceptions) or attempt == retry.attempts:
+                raise WebRequestError(method, url, attempt, cause=e) from e
+            logger.warning(f'Exception {type(e).__name__} Happened when async {method.lower()} {url}')
+        else:
+            if response.status_code in retry.retry_status and attempt < retry.attempts:
+                logger.warning(f'Status Code {response.status_code} when async {method.lower()} {url}')
+            elif response.status_code >= 400:
+                raise WebRequestError(method, url, attempt, response=response)
+            else:
+                return response
+        delay = retry.delay(attempt, response)
+        logger.info(f'Retry async {method.lower()} {url} in {delay:.2f}s (Attempt {attempt + 1}/{retry.attempts})')
+        await asyncio.sleep(delay)
+
+
+async def async_get(url: str, proxy: bool = False, headers: dict = None, params: dict = None,
+                    retry: RetryPolicy = None, **kwargs):
+    if not WEB_SINGLE_FLIGHT:
+        return await async_request('GET', url, proxy, retry, headers=headers, params=params, **kwargs)
+    return await single_flight.do(
+        single_flight.key('GET', url, proxy, headers, params, **kwargs),
+        lambda: async_request('GET', url, proxy, retry, headers=headers, params=params, **kwargs)
+    )
+
+
+async def async_post(url: str, proxy: bool = False, headers: dict = None, data: dict = None,
+                     retry: RetryPolicy = None, **kwargs):
+    return await async_request('POST', url, proxy, retry or NO_RETRY, headers=headers, data=data, **kwargs)
+
+
+async def async_head(url: str, proxy: bool = False, headers: dict = None, params: dict = None,
+                     retry: RetryPolicy = None):
+    if not WEB_SINGLE_FLIGHT:
+        return await async_request('HEAD', url, proxy, retry, headers=headers, params=params)
+    return await single_flight.do(
+        single_flight.key('HEAD', url, proxy, headers, params),
+        lambda: async_request('HEAD', url, proxy, retry, headers=headers, params=params)
+    )
+
+
+class CacheEntry:
+    def __init__(self, content: bytes, content_type: str = None, etag: str = None,
+                 last_modified: str = None, expires: float = 0, status: int = 200):
+        self.content = content
+        self.status = status
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+    def meta(self) -> dict:
+        return {
+            'content_type': self.content_type,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'expires': self.expires,
+            'status': self.status,
+        }
+
+    def response(self) -> httpx.Response:
+        headers = {'Content-Type': self.content_type} if self.content_type else {}
+        return httpx.Response(self.status, headers=headers, content=self.content)
+
+
+class ResponseCache:
+    """
+    HTTP响应缓存 仅在调用时指定 cache_ttl 才会使用
+    内存中按LRU保留 总大小不超过 WEB_CACHE_MEMORY_BYTES
+    WEB_CACHE_DISK 开启时同时写入 RESOURCE/cache/web 总大小不超过 WEB_CACHE_DISK_BYTES
+    过期后若有 ETag/Last-Modified 则发送条件请求 内容未变化时服务器只需返回304
+    """
+
+    def __init__(self, memory_bytes: int, disk_path: str = None, disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_path = disk_path
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stale = 0
+        self._memory: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict[str, int] | None = None
+        self._disk_size = 0
+        self._disk_lock = threading.Lock()
+
+    async def fetch(self, url: str, ttl: float, proxy: bool = False, headers: dict = None,
+                    params: dict = None, retry: RetryPolicy = None) -> httpx.Response:
+        key = SingleFlight.key('GET', url, proxy, headers, params)
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        elif self.disk_path:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is not None and entry.expires > time.time():
+            self.hits += 1
+            return entry.response()
+        # 同一地址的并发刷新只发送一次请求
+        result = await single_flight.do(
+            f'cache:{key}', lambda: self._refresh(key, entry, url, ttl, proxy, headers, params, retry)
+        )
+        return result.response() if isinstance(result, CacheEntry) else result
+
+    async def _refresh(self, key: str, entry: CacheEntry | None, url: str, ttl: float, proxy: bool,
+                       headers: dict, params: dict, retry: RetryPolicy) -> CacheEntry | httpx.Response:
+        """
+        只缓存200响应与对已缓存内容的304确认 其他2xx/3xx响应原样返回
+        状态码>=400或请求失败时 若有过期的缓存则返回过期内容(stale-if-error) 否则抛出 WebRequestError
+        """
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag:
+                request_headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                request_headers['If-Modified-Since'] = entry.last_modified
+        try:
+            response = await async_get(url, proxy, request_headers, params, retry)
+        except WebRequestError as e:
+            if entry is None:
+                raise
+            # 不延长有效期 下次请求时再次尝试刷新
+            self.stale += 1
+            logger.warning(f'Revalidate {url} Failed: {e}, Serving Stale Response')
+            return entry
+        now = time.time()
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            entry.expires = now + ttl
+            entry.etag = response.headers.get('ETag', entry.etag)
+            entry.last_modified = response.headers.get('Last-Modified', entry.last_modified)
+        else:
+            self.misses += 1
+            if response.status_code != 200:
+                return response
+            entry = CacheEntry(
+                response.content,
+                response.headers.get('Content-Type'),
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                now + ttl,
+            )
+        self._remember(key, entry)
+        if self.disk_path:
+            await asyncio.to_thread(self._write_disk, key, entry)
+        return entry
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_size = 0
+
+    def _remember(self, key: str, entry: CacheEntry):
+        if key in self._memory:
+            self._memory_size -= self._memory.pop(key).size
+        if entry.size > self.memory_bytes:
+            return
+        self._memory[key] = entry
+        self._memory_size += entry.size
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= evicted.size
+
+    def _disk_index(self) -> OrderedDict:
+        if self._disk is None:
+            os.makedirs(self.disk_path, exist_ok=True)
+            files = [
+                entry for entry in os.scandir(self.disk_path)
+                if entry.is_file() and entry.name.endswith('.bin')
+            ]
+            files.sort(key=lambda entry: entry.stat().st_mtime)
+            self._disk = OrderedDict((entry.name.removesuffix('.bin'), entry.stat().st_size) for entry in files)
+            self._disk_size = sum(self._disk.values())
+        return self._disk
+
+    def _read_disk(self, key: str) -> CacheEntry | None:
+        with self._disk_lock:
+            index = self._disk_index()
+            if key not in index:
+                return None
+            base = os.path.join(self.disk_path, key)
+            try:
+                with open(base + '.json', 'r', encoding='utf-8') as fp:
+                    meta = json.load(fp)
+                with open(base + '.bin', 'rb') as fp:
+                    content = fp.read()
+            except (OSError, ValueError):
+                self._disk_size -= index.pop(key)
+                return None
+            index.move_to_end(key)
+            return CacheEntry(content, **meta)
+
+    def _write_disk(self, key: str, entry: CacheEntry):
+        with self._disk_lock:
+            index = self._disk_index()
+            base = os.path.join(self.disk_path, key)
+            for suffix, data, mode in (('.bin', entry.content, 'wb'), ('.json', json.dumps(entry.meta()), 'w')):
+                with open(f'{base}{suffix}.tmp', mode) as fp:
+                    fp.write(data)
+                os.replace(f'{base}{suffix}.tmp', base + suffix)
+            self._disk_size += entry.size - index.pop(key, 0)
+            index[key] = entry.size
+            while self._disk_size > self.disk_bytes and len(index) > 1:
+                self._evict_disk(index)
+
+    def _evict_disk(self, index: OrderedDict):
+        evicted, size = index.popitem(last=False)
+        self._disk_size -= size
+        for suffix in ('.bin', '.json'):
+            try:
+                os.remove(os.path.join(self.disk_path, evicted + suffix))
+            except OSError:
+                pass
+
+
+response_cache = ResponseCache(
+    WEB_CACHE_MEMORY_BYTES,
+    os.path.join(RESOURCE, 'cache', 'web') if WEB_CACHE_DISK else None,
+    WEB_CACHE_DISK_BYTES,
+)
 
 
 async def async_get_json(
-        url: str, proxy: bool = False, headers: dict = None, params: dict = None
+        url: str, proxy: bool = False, headers: dict = None, params: dict = None, cache_ttl: float = None
 ):
-    response = await async_get(url, proxy, headers, params)
+    """
+    cache_ttl: 缓存有效期(秒) 为None时不使用缓存
+    """
+    if cache_ttl is None:
+        response = await async_get(url, proxy, headers, params)
+    else:
+        response = await response_cache.fetch(url, cache_ttl, proxy, headers, params)
     try:
         result = response.json()
     except Exception as e:
@@ -85,18 +484,166 @@ async def async_get_json(
     return result
 
 
+_download_slots: asyncio.Semaphore | None = None
+
+
+def _download_semaphore() -> asyncio.Semaphore:
+    global _download_slots
+    if _download_slots is None:
+        _download_slots = asyncio.Semaphore(WEB_DOWNLOAD_CONCURRENCY)
+    return _download_slots
+
+
+def _read_head(path: str, size: int) -> bytes:
+    with open(path, 'rb') as fp:
+        return fp.read(size)
+
+
+def _resume_offset(part: str, url: str) -> tuple[int, dict | None]:
+    """
+    返回临时文件可以续传的位置与其来源信息
+    没有来源记录 来源地址不同或没有可用于 If-Range 的校验值时不续传
+    """
+    if not os.path.exists(part):
+        return 0, None
+    try:
+        with open(f'{part}.json', 'r', encoding='utf-8') as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return 0, None
+    if meta.get('url') != url or not _if_range(meta):
+        return 0, None
+    return os.path.getsize(part), meta
+
+
+def _if_range(meta: dict) -> str | None:
+    # If-Range 只能使用强ETag
+    etag = meta.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return meta.get('last_modified')
+
+
+def _write_part_meta(part: str, url: str, response: httpx.Response):
+    meta = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    with open(f'{part}.json', 'w', encoding='utf-8') as fp:
+        json.dump(meta, fp)
+
+
+def _remove_part(part: str):
+    for file in (part, f'{part}.json'):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+
+def _content_range_start(response: httpx.Response) -> int | None:
+    # Content-Range: bytes start-end/total
+    match = re.match(r'bytes\s+(\d+)-', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+async def async_stream_download(
+        url: str, path: str, proxy: bool = False, headers: dict = None,
+        detect_type: bool = False, overwrite: bool = True, retry: RetryPolicy = None
+) -> str:
+    """
+    流式下载文件 内存占用与文件大小无关
+    数据分块经线程池写入 path.part 完成后原子重命名为目标文件
+    中断后再次下载同一文件时 通过HTTP Range从已下载的位置继续
+    path.part.json 记录临时文件的来源地址与ETag/Last-Modified 续传时以 If-Range 确认远端文件未变化
+    全局同时进行的下载数不超过 WEB_DOWNLOAD_CONCURRENCY
+
+    Args:
+        detect_type: path没有扩展名时 根据文件头识别类型并补全扩展名
+        overwrite: 为假时目标文件已存在则抛出FileExistsError
+    Returns:
+        最终的文件路径
+    """
+    retry = retry or DEFAULT_RETRY
+    loop = asyncio.get_running_loop()
+    part = f'{path}.part'
+    head_size = 261  # filetype识别类型所需的最大字节数
+    await loop.run_in_executor(None, functools.partial(os.makedirs, os.path.dirname(path) or '.', exist_ok=True))
+    async with _download_semaphore():
+        attempt = 0
+        while True:
+            attempt += 1
+            offset, meta = await loop.run_in_executor(None, _resume_offset, part, url)
+            request_headers = dict(headers or {})
+            if offset:
+                request_headers['Range'] = f'bytes={offset}-'
+                request_headers['If-Range'] = _if_range(meta)
+            try:
+                async with client_pool.host_limit(url):
+                    async with client_pool.client(proxy).stream('GET', url, headers=request_headers) as response:
+                        if response.status_code == 416 and offset:
+                            # 服务器不接受续传位置 丢弃临时文件重新下载
+                            await loop.run_in_executor(None, _remove_part, part)
+                            continue
+                        if response.status_code >= 400:
+                            if response.status_code in retry.retry_status and attempt < retry.attempts:
+                                await asyncio.sleep(retry.delay(attempt, response))
+                                continue
+                            raise WebRequestError('GET', url, attempt, response=response)
+                        if response.status_code == 206 and offset and _content_range_start(response) != offset:
+                            # 返回的范围与临时文件不衔接 丢弃临时文件重新下载
+                            logger.warning(f'Download {url} Returned Unexpected Content-Range, Restarting')
+                            await loop.run_in_executor(None, _remove_part, part)
+                            continue
+                        if response.status_code != 206:
+                            offset = 0  # 服务器忽略了Range或远端文件已变化 从头写入
+                        if not offset:
+                            await loop.run_in_executor(None, _write_part_meta, part, url, response)
+                        fp = await loop.run_in_executor(None, open, part, 'ab' if offset else 'wb')
+                        try:
+                            async for chunk in response.aiter_bytes(WEB_DOWNLOAD_CHUNK_SIZE):
+                                await loop.run_in_executor(None, fp.write, chunk)
+                        finally:
+                            await loop.run_in_executor(None, fp.close)
+                break
+            except WebRequestError:
+                raise
+            except httpx.HTTPError as e:
+                if not isinstance(e, retry.retry_exceptions) or attempt >= retry.attempts:
+                    raise WebRequestError('GET', url, attempt, cause=e) from e
+                logger.warning(f'Download {url} Interrupted: {type(e).__name__}, Resuming')
+                await asyncio.sleep(retry.delay(attempt))
+
+    target = path
+    if detect_type and not os.path.splitext(path)[1]:
+        mime = filetype.guess_mime(await loop.run_in_executor(None, _read_head, part, head_size))
+        if mime:
+            target += f'.{mime.split("/")[1]}'
+    if not overwrite and os.path.exists(target):
+        await loop.run_in_executor(None, _remove_part, part)
+        raise FileExistsError("File Already Exists")
+    await loop.run_in_executor(None, os.replace, part, target)
+    await loop.run_in_executor(None, _remove_part, part)
+    return target
+
+
 async def async_download(url: str, path: str, filename: str, proxy: bool = False, headers: dict = None):
     """异步下载文件"""
-    # content = await async_get_content(url, proxy, headers)
-    response = await async_get(url, proxy, headers)
-    content = response.read()
-    with open(path + filename, 'wb') as file_output:
-        file_output.write(content)
-        return True
+    await async_stream_download(url, path + filename, proxy, headers)
+    return True
 
 
-async def async_get_content(url: str, proxy: bool = False, headers: dict = None, params: dict = None):
-    response = await async_get(url, proxy, headers, params)
+async def async_get_content(
+        url: str, proxy: bool = False, headers: dict = None, params: dict = None, cache_ttl: float = None
+):
+    """
+    cache_ttl: 缓存有效期(秒) 为None时不使用缓存
+    """
+    if cache_ttl is None:
+        response = await async_get(url, proxy, headers, params)
+    else:
+        response = await response_cache.fetch(url, cache_ttl, proxy, headers, params)
     return response.read()
 
 
@@ -106,12 +653,11 @@ yourls_api = "http://s.xbb.moe/yourls-api.php"
 
 async def get_short_url(url: str):
     try:
-        async with httpx.AsyncClient(proxies=HTTPX_PROXY, timeout=TIMEOUT) as client:
-            querystring = {"action": "shorturl", "url": url, "signature": "f9a7df5592", "format": "json"}
-            response = await client.get(yourls_api, params=querystring)
-            assert response.status_code in [200, 400], "失败"
-            shorturl = response.json()['shorturl']
-            return shorturl
+        querystring = {"action": "shorturl", "url": url, "signature": "f9a7df5592", "format": "json"}
+        response = await client_pool.request('GET', yourls_api, True, params=querystring)
+        assert response.status_code in [200, 400], "失败"
+        shorturl = response.json()['shorturl']
+        return shorturl
     except Exception as e:
         logger.error(f'Exception "{e}" Happened when get short url of {url}')
         return url